@@ -39,8 +39,14 @@ CREATE TABLE IF NOT EXISTS contacts (
   account_num CHAR(10) NOT NULL,
   routing_num CHAR(9) NOT NULL,
   is_external BOOLEAN NOT NULL,
-  FOREIGN KEY (username) REFERENCES users(username)
+  FOREIGN KEY (username) REFERENCES users(username),
+  CONSTRAINT uq_contacts_account UNIQUE (username, account_num, routing_num),
+  CONSTRAINT uq_contacts_label UNIQUE (username, label)
 );
 
 CREATE INDEX IF NOT EXISTS idx_contacts_username ON contacts (username);
+-- Label prefix search; ordering by label and account number lookups use
+-- the indexes of the unique constraints.
+CREATE INDEX IF NOT EXISTS idx_contacts_username_label_prefix
+  ON contacts (username, label text_pattern_ops);
 
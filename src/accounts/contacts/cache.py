@@ -0,0 +1,139 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+cache keeps recently read contacts lists in memory
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def contacts_version(contacts):
+    """Return a version string that changes whenever the contacts list does.
+
+    It is derived from the contents, so every replica computes the same
+    version for the same list, including after a restart.
+    """
+    serialized = json.dumps(contacts, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(serialized.encode()).hexdigest()[:32]
+
+
+class ContactsCache:
+    """
+    Thread-safe LRU cache of contacts lists keyed by username.
+    Entries expire ttl seconds after they are read from the database.
+    Each list is cached with its version, see contacts_version.
+    """
+
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        # bumped by every invalidation, so a read that raced a write
+        # doesn't put the old list back in the cache
+        self.generation = 0
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """Whether anything is ever cached"""
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, username, load):
+        """Return the contacts of username, calling load(username) on a miss.
+
+        Return: a list of contacts, which the caller may modify
+        """
+        return self.get_versioned(username, load)[0]
+
+    def get_versioned(self, username, load):
+        """Like get, but also return the version of the list.
+
+        Return: (contacts, version)
+        """
+        with self.lock:
+            entry = self.entries.get(username)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(username)
+                self.counters["hits"] += 1
+                return list(entry[1]), entry[2]
+            if entry is not None:
+                del self.entries[username]
+            self.counters["misses"] += 1
+            generation = self.generation
+
+        contacts = load(username)
+        version = contacts_version(contacts)
+        if self.enabled:
+            self._set(username, contacts, version, generation)
+        return list(contacts), version
+
+    def _set(self, username, contacts, version, generation):
+        """Cache contacts unless the cache was invalidated since generation"""
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[username] = (time.monotonic() + self.ttl, list(contacts), version)
+            self.entries.move_to_end(username)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def invalidate(self, username):
+        """Drop the cached contacts of username"""
+        with self.lock:
+            self.generation += 1
+            if self.entries.pop(username, None) is not None:
+                self.counters["invalidations"] += 1
+
+    def clear(self):
+        """Drop every cached contacts list"""
+        with self.lock:
+            self.generation += 1
+            self.counters["invalidations"] += len(self.entries)
+            self.entries.clear()
+
+    def stats(self):
+        """Return the number of cached lists and the hit/miss counters"""
+        with self.lock:
+            return dict(self.counters, size=len(self.entries))
+
+    def metrics(self):
+        """Return the cache stats in the Prometheus text format"""
+        stats = self.stats()
+        lookups = stats["hits"] + stats["misses"]
+        lines = [
+            "# HELP contacts_cache_entries Contacts lists in the cache",
+            "# TYPE contacts_cache_entries gauge",
+            "contacts_cache_entries {}".format(stats["size"]),
+            "# HELP contacts_cache_lookups_total Contacts cache lookups by result",
+            "# TYPE contacts_cache_lookups_total counter",
+            'contacts_cache_lookups_total{{result="hit"}} {}'.format(stats["hits"]),
+            'contacts_cache_lookups_total{{result="miss"}} {}'.format(stats["misses"]),
+            "# HELP contacts_cache_hit_ratio Share of contacts cache lookups that hit",
+            "# TYPE contacts_cache_hit_ratio gauge",
+            "contacts_cache_hit_ratio {}".format(stats["hits"] / lookups if lookups else 0),
+            "# HELP contacts_cache_evictions_total Contacts lists evicted to make room",
+            "# TYPE contacts_cache_evictions_total counter",
+            "contacts_cache_evictions_total {}".format(stats["evictions"]),
+            "# HELP contacts_cache_invalidations_total Contacts lists dropped after a change",
+            "# TYPE contacts_cache_invalidations_total counter",
+            "contacts_cache_invalidations_total {}".format(stats["invalidations"]),
+        ]
+        return "\n".join(lines) + "\n"
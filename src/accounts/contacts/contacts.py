@@ -18,6 +18,8 @@ Manages internal user contacts and external accounts.
 """
 
 import atexit
+import base64
+import binascii
 import logging
 import os
 import re
@@ -36,9 +38,12 @@ from opentelemetry.exporter.cloud_trace import CloudTraceSpanExporter
 from opentelemetry.propagators.cloud_trace_propagator import CloudTraceFormatPropagator
 from opentelemetry.instrumentation.flask import FlaskInstrumentor
 
+from cache import ContactsCache
 from db import ContactsDb
+from pool import pool_metrics
 
 
+# pylint: disable-msg=too-many-locals
 def create_app():
     """Flask application factory to create instances
     of the Contact Service Flask App
@@ -61,31 +66,54 @@ def create_app():
         """Readiness probe."""
         return "ok", 200
 
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        """Contacts cache and database pool metrics in the Prometheus text format."""
+        text = contacts_cache.metrics() + pool_metrics(contacts_db.pool_stats(), "contacts")
+        return text, 200, {"Content-Type": "text/plain; version=0.0.4"}
+
     @app.route("/contacts/<username>", methods=["GET"])
     def get_contacts(username):
         """Retrieve the contacts list for the authenticated user.
         This list is used for populating Payment and Deposit fields.
 
-        Return: a list of contacts
+        optional query parameters:
+        - label_prefix: only contacts whose label starts with this
+        - account_num: only contacts with this account number
+        - limit: return at most this many contacts, ordered by label
+        - cursor: continue after the page that returned this X-Next-Cursor
+
+        The full list carries an ETag; a request whose If-None-Match holds
+        it gets a 304 and, while the list is cached, no database read.
+
+        Return: a list of contacts, with the number of matching contacts in
+                X-Total-Count and, if more follow, X-Next-Cursor
         """
-        auth_header = request.headers.get("Authorization")
-        if auth_header:
-            token = auth_header.split(" ")[-1]
-        else:
-            token = ""
         try:
-            auth_payload = jwt.decode(
-                token, key=app.config["PUBLIC_KEY"], algorithms="RS256"
-            )
-            if username != auth_payload["user"]:
-                raise PermissionError
-
-            contacts_list = contacts_db.get_contacts(username)
+            _authorize(username)
+            query = _parse_contacts_query(request.args)
+            headers = {}
+            if query:
+                contacts_list, total, more = contacts_db.search_contacts(username, **query)
+                if more:
+                    headers["X-Next-Cursor"] = _encode_cursor(contacts_list[-1]["label"])
+            else:
+                contacts_list, version = contacts_db.get_contacts_versioned(username)
+                total = len(contacts_list)
+                headers["ETag"] = '"{}"'.format(version)
+                headers["Cache-Control"] = "private, no-cache"
+                if request.if_none_match.contains_weak(version):
+                    app.logger.debug("Contacts not modified.")
+                    return "", 304, headers
+            headers["X-Total-Count"] = str(total)
             app.logger.debug("Successfully retrieved contacts.")
-            return jsonify(contacts_list), 200
+            return jsonify(contacts_list), 200, headers
         except (PermissionError, jwt.exceptions.InvalidTokenError) as err:
             app.logger.error("Error retrieving contacts list: %s", str(err))
             return "authentication denied", 401
+        except UserWarning as warn:
+            app.logger.error("Error retrieving contacts list: %s", str(warn))
+            return str(warn), 400
         except SQLAlchemyError as err:
             app.logger.error("Error retrieving contacts list: %s", str(err))
             return "failed to retrieve contacts list", 500
@@ -103,32 +131,14 @@ def create_app():
         - label
         - is_external
         """
-        auth_header = request.headers.get("Authorization")
-        if auth_header:
-            token = auth_header.split(" ")[-1]
-        else:
-            token = ""
         try:
-            auth_payload = jwt.decode(
-                token, key=app.config["PUBLIC_KEY"], algorithms="RS256"
-            )
-            if username != auth_payload["user"]:
-                raise PermissionError
-            req = {
-                k: (bleach.clean(v) if isinstance(v, str) else v)
-                for k, v in request.get_json().items()
-            }
+            auth_payload = _authorize(username)
+            req = _clean(request.get_json())
             _validate_new_contact(req)
 
-            _check_contact_allowed(username, auth_payload["acct"], req)
+            _check_contact_allowed(auth_payload["acct"], req)
             # Create contact data to be added to the database.
-            contact_data = {
-                "username": username,
-                "label": req["label"],
-                "account_num": req["account_num"],
-                "routing_num": req["routing_num"],
-                "is_external": req["is_external"],
-            }
+            contact_data = _contact_data(username, req)
             # Add contact_data to database
             app.logger.debug("Adding new contact to the database.")
             contacts_db.add_contact(contact_data)
@@ -148,6 +158,151 @@ def create_app():
             app.logger.error("Error adding contact: %s", str(err))
             return "failed to add contact", 500
 
+    @app.route("/contacts/<username>/bulk", methods=["POST"])
+    def add_contacts(username):
+        """Add many accounts to user's contacts list at once
+
+        The request body is a JSON list of contacts with the fields of
+        POST /contacts/<username>. Either all of them are added or, if any
+        is invalid or a duplicate, none.
+
+        Return: the number of contacts added, or a list of errors with the
+                index of the contact each is about
+        """
+        try:
+            auth_payload = _authorize(username)
+            rows = request.get_json()
+            if not isinstance(rows, list) or not rows:
+                raise UserWarning("expected a non-empty list of contacts")
+            if len(rows) > app.config["MAX_BULK_SIZE"]:
+                raise UserWarning("at most {} contacts may be added at once".format(
+                    app.config["MAX_BULK_SIZE"]))
+            contacts, errors = _check_bulk_contacts(username, auth_payload["acct"], rows)
+            if errors:
+                app.logger.error("Error adding contacts: %d invalid", len(errors))
+                return jsonify({"errors": errors}), 400
+            app.logger.debug("Adding %d contacts to the database.", len(contacts))
+            contacts_db.add_contacts(contacts)
+            app.logger.info("Successfully added %d contacts.", len(contacts))
+            return jsonify({"added": len(contacts)}), 201
+
+        except (PermissionError, jwt.exceptions.InvalidTokenError) as err:
+            app.logger.error("Error adding contacts: %s", str(err))
+            return "authentication denied", 401
+        except UserWarning as warn:
+            app.logger.error("Error adding contacts: %s", str(warn))
+            return str(warn), 400
+        except ValueError as err:
+            # a contact added since the duplicate check
+            app.logger.error("Error adding contacts: %s", str(err))
+            return str(err), 409
+        except SQLAlchemyError as err:
+            app.logger.error("Error adding contacts: %s", str(err))
+            return "failed to add contacts", 500
+
+    def _check_bulk_contacts(username, accountid, rows):
+        """Validate a batch of new contacts against each other and the existing ones.
+
+        Return: (contacts, errors). contacts holds the rows to insert,
+                errors the index and reason of every rejected row.
+        """
+        existing = contacts_db.get_contacts(username)
+        accounts = {(c["account_num"], c["routing_num"]) for c in existing}
+        labels = {c["label"] for c in existing}
+        contacts = []
+        errors = []
+        for index, row in enumerate(rows):
+            try:
+                if not isinstance(row, dict):
+                    raise UserWarning("invalid contact")
+                req = _clean(row)
+                _validate_new_contact(req)
+                _check_contact_allowed(accountid, req)
+                if (req["account_num"], req["routing_num"]) in accounts:
+                    raise ValueError("account already exists as a contact")
+                if req["label"] in labels:
+                    raise ValueError("contact already exists with that label")
+            except (UserWarning, ValueError) as err:
+                errors.append({"index": index, "error": str(err)})
+                continue
+            except TypeError:
+                # a field of the wrong JSON type
+                errors.append({"index": index, "error": "invalid contact"})
+                continue
+            accounts.add((req["account_num"], req["routing_num"]))
+            labels.add(req["label"])
+            contacts.append(_contact_data(username, req))
+        return contacts, errors
+
+    def _authorize(username):
+        """Check that the request's token was issued to username.
+
+        Return: the decoded token
+        Raises: PermissionError or jwt.exceptions.InvalidTokenError
+        """
+        auth_header = request.headers.get("Authorization")
+        if auth_header:
+            token = auth_header.split(" ")[-1]
+        else:
+            token = ""
+        auth_payload = jwt.decode(
+            token, key=app.config["PUBLIC_KEY"], algorithms="RS256"
+        )
+        if username != auth_payload["user"]:
+            raise PermissionError
+        return auth_payload
+
+    def _clean(req):
+        """Sanitize the string fields of a contact request"""
+        return {k: (bleach.clean(v) if isinstance(v, str) else v) for k, v in req.items()}
+
+    def _contact_data(username, req):
+        """Create contact data to be added to the database"""
+        return {
+            "username": username,
+            "label": req["label"],
+            "account_num": req["account_num"],
+            "routing_num": req["routing_num"],
+            "is_external": req["is_external"],
+        }
+
+    def _parse_contacts_query(args):
+        """Parse the search and paging parameters of a contacts list request.
+
+        Return: keyword arguments for contacts_db.search_contacts, empty if
+                the full list was requested
+        Raises: UserWarning if a parameter is invalid
+        """
+        query = {}
+        if args.get("label_prefix"):
+            query["label_prefix"] = args["label_prefix"]
+        if args.get("account_num"):
+            query["account_num"] = args["account_num"]
+        if "limit" in args:
+            try:
+                query["limit"] = int(args["limit"])
+            except ValueError as err:
+                raise UserWarning("invalid limit") from err
+            if not 1 <= query["limit"] <= app.config["MAX_PAGE_SIZE"]:
+                raise UserWarning("invalid limit")
+        if "cursor" in args:
+            query["after"] = _decode_cursor(args["cursor"])
+        return query
+
+    def _encode_cursor(label):
+        """Return an opaque cursor for the page after the contact with label"""
+        return base64.urlsafe_b64encode(label.encode()).decode()
+
+    def _decode_cursor(cursor):
+        """Return the label a cursor from _encode_cursor was made from"""
+        try:
+            label = base64.b64decode(cursor.encode(), altchars=b"-_", validate=True).decode()
+        except (binascii.Error, UnicodeError) as err:
+            raise UserWarning("invalid cursor") from err
+        if not label:
+            raise UserWarning("invalid cursor")
+        return label
+
     def _validate_new_contact(req):
         """Check that this new contact request has valid fields"""
         app.logger.debug("validating add contact request: %s", str(req))
@@ -170,22 +325,16 @@ def create_app():
         if req["label"] is None or not re.match(r"^[0-9a-zA-Z][0-9a-zA-Z ]{0,29}$", req["label"]):
             raise UserWarning("invalid account label")
 
-    def _check_contact_allowed(username, accountid, req):
-        """Check that this contact is allowed to be created"""
+    def _check_contact_allowed(accountid, req):
+        """Check that this contact is allowed to be created.
+
+        Identical contacts are rejected by contacts_db.add_contact.
+        """
         app.logger.debug("checking that this contact is allowed to be created: %s", str(req))
         # Don't allow self reference
         if (req["account_num"] == accountid and req["routing_num"] == app.config["LOCAL_ROUTING"]):
             raise ValueError("may not add yourself to contacts")
 
-        # Don't allow identical contacts
-        for contact in contacts_db.get_contacts(username):
-            if (contact["account_num"] == req["account_num"]
-                    and contact["routing_num"] == req["routing_num"]):
-                raise ValueError("account already exists as a contact")
-
-            if contact["label"] == req["label"]:
-                raise ValueError("contact already exists with that label")
-
     @atexit.register
     def _shutdown():
         """Executed when web app is terminated."""
@@ -214,10 +363,22 @@ def create_app():
     app.config["VERSION"] = os.environ.get("VERSION")
     app.config["LOCAL_ROUTING"] = os.environ.get("LOCAL_ROUTING_NUM")
     app.config["PUBLIC_KEY"] = open(os.environ.get("PUB_KEY_PATH"), "r").read()
+    app.config["MAX_PAGE_SIZE"] = int(os.environ.get("CONTACTS_MAX_PAGE_SIZE", "500"))
+    app.config["MAX_BULK_SIZE"] = int(os.environ.get("CONTACTS_MAX_BULK_SIZE", "1000"))
 
-    # Configure database connection
+    # Configure contacts cache and database connection
+    contacts_cache = ContactsCache(
+        max_size=int(os.environ.get("CONTACTS_CACHE_SIZE", "1024")),
+        ttl=float(os.environ.get("CONTACTS_CACHE_TTL", "60")),
+    )
     try:
-        contacts_db = ContactsDb(os.environ.get("ACCOUNTS_DB_URI"), app.logger)
+        contacts_db = ContactsDb(
+            os.environ.get("ACCOUNTS_DB_URI"),
+            app.logger,
+            cache=contacts_cache,
+            notify=os.environ.get("CONTACTS_CACHE_NOTIFY", "false") == "true",
+        )
+        contacts_db.listen_for_changes()
     except OperationalError:
         app.logger.critical("database connection failed")
         sys.exit(1)
@@ -17,9 +17,29 @@ db manages interactions with the underlying database
 """
 
 import logging
-from sqlalchemy import create_engine, MetaData, Table, Column, String, Boolean
+import select
+import threading
+import time
+
+from sqlalchemy import create_engine, MetaData, Table, Column, String, Boolean, \
+    UniqueConstraint, func, select as sql_select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import NullPool
 from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
 
+from cache import ContactsCache
+from pool import engine_options, pool_stats
+
+
+# unique constraint name -> message for a contact that violates it
+CONFLICT_MESSAGES = {
+    "uq_contacts_account": "account already exists as a contact",
+    "uq_contacts_label": "contact already exists with that label",
+}
+
+# postgres channel on which replicas announce changed contacts lists
+CHANGES_CHANNEL = "contacts_changed"
+
 
 class ContactsDb:
     """
@@ -27,9 +47,17 @@ class ContactsDb:
     to handle db operations for contact service.
     """
 
-    def __init__(self, uri, logger=logging):
-        self.engine = create_engine(uri)
+    def __init__(self, uri, logger=logging, cache=None, notify=False):
+        """
+        Params: cache - a ContactsCache that get_contacts reads through,
+                    or None for a cache that holds nothing
+                notify - whether to tell other replicas to drop their cached
+                    contacts when one is added; postgres only
+        """
+        self.engine = create_engine(uri, **engine_options(uri))
         self.logger = logger
+        self.cache = cache if cache is not None else ContactsCache(max_size=0)
+        self.notify = notify and self.engine.dialect.name == "postgresql"
         self.contacts_table = Table(
             "contacts",
             MetaData(self.engine),
@@ -38,6 +66,9 @@ class ContactsDb:
             Column("account_num", String, nullable=False),
             Column("routing_num", String, nullable=False),
             Column("is_external", Boolean, nullable=False),
+            UniqueConstraint("username", "account_num", "routing_num",
+                             name="uq_contacts_account"),
+            UniqueConstraint("username", "label", name="uq_contacts_label"),
         )
 
         # Set up tracing autoinstrumentation for sqlalchemy
@@ -46,40 +77,199 @@ class ContactsDb:
             service="contacts",
         )
 
+    def pool_stats(self):
+        """Return the size, in-use and overflow connection counts of the pool"""
+        return pool_stats(self.engine)
+
     def add_contact(self, contact):
         """Add a contact under the specified username.
 
+        Duplicates are rejected by the table's unique constraints, so the
+        check and the insert are a single statement.
+
         Params: user - a key/value dict of attributes describing a new contact
                     {'username': username, 'label': label, ...}
-        Raises: SQLAlchemyError if there was an issue with the database
+        Raises: ValueError if the user already has a contact with that
+                    account or label
+                SQLAlchemyError if there was an issue with the database
         """
-        statement = self.contacts_table.insert().values(contact)
-        self.logger.debug("QUERY: %s", str(statement))
-        with self.engine.connect() as conn:
-            conn.execute(statement)
+        self.add_contacts([contact])
+
+    def add_contacts(self, contacts):
+        """Add several contacts in one transaction, all or none.
+
+        The rows are sent in a single executemany.
+
+        Params: contacts - a list of key/value dicts like those of add_contact
+        Raises: ValueError if a contact conflicts with an existing one or
+                    with another in the list
+                SQLAlchemyError if there was an issue with the database
+        """
+        statement = self.contacts_table.insert()
+        usernames = {contact["username"] for contact in contacts}
+        self.logger.debug("QUERY: %s (%d rows)", str(statement), len(contacts))
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(statement, contacts)
+                if self.notify:
+                    # delivered to the listeners when the insert commits
+                    for username in usernames:
+                        conn.execute(sql_select(func.pg_notify(CHANGES_CHANNEL, username)))
+        except IntegrityError as err:
+            constraint = self._violated_constraint(err)
+            if constraint is None:
+                raise
+            raise ValueError(CONFLICT_MESSAGES[constraint]) from err
+        for username in usernames:
+            self.cache.invalidate(username)
+
+    def _violated_constraint(self, err):
+        """Return the name of the unique constraint err violated, if it is one of ours"""
+        # postgres reports the constraint name
+        diag = getattr(err.orig, "diag", None)
+        name = getattr(diag, "constraint_name", None)
+        if name in CONFLICT_MESSAGES:
+            return name
+        # sqlite reports the columns, e.g. "UNIQUE constraint failed: contacts.username, ..."
+        message = str(err.orig)
+        for constraint in self.contacts_table.constraints:
+            if constraint.name not in CONFLICT_MESSAGES:
+                continue
+            columns = ", ".join("contacts." + column.name for column in constraint.columns)
+            if message.endswith("UNIQUE constraint failed: " + columns):
+                return constraint.name
+        return None
 
     def get_contacts(self, username):
         """Get a list of contacts for the specified username.
 
+        Lists are served from the cache while fresh.
+
         Params: username - the username of the user
         Return: a list of contacts in the form of key/value attribute dicts,
                 [ {'label': contact1, ...}, {'label': contact2, ...}, ...]
         Raises: SQLAlchemyError if there was an issue with the database
         """
+        return self.cache.get(username, self._select_contacts)
+
+    def get_contacts_versioned(self, username):
+        """Get the contacts of username and the version of the list.
+
+        While the list is cached, neither reads the database. The version
+        changes whenever a contact is added.
+
+        Return: (contacts, version), contacts as returned by get_contacts
+        Raises: SQLAlchemyError if there was an issue with the database
+        """
+        return self.cache.get_versioned(username, self._select_contacts)
+
+    def search_contacts(self, username, label_prefix=None, account_num=None,
+                        after=None, limit=None):
+        """Get one page of the contacts of username, ordered by label.
+
+        Filtering, ordering and paging happen in the database, so only the
+        contacts on the page are read. Pages are not cached.
+
+        Params: username - the username of the user
+                label_prefix - only contacts whose label starts with this
+                account_num - only contacts with this account number
+                after - only contacts whose label sorts after this, i.e. the
+                    label of the last contact of the previous page
+                limit - the maximum number of contacts returned, or None for all
+        Return: (contacts, total, more). contacts is a list of key/value
+                attribute dicts, total is the number of contacts matching the
+                filters on all pages, more is whether contacts follow this page.
+        Raises: SQLAlchemyError if there was an issue with the database
+        """
+        table = self.contacts_table
+        conditions = [table.c.username == username]
+        if label_prefix:
+            conditions.append(table.c.label.startswith(label_prefix, autoescape=True))
+        if account_num:
+            conditions.append(table.c.account_num == account_num)
+        count = sql_select(func.count()).select_from(table).where(*conditions)
+        statement = table.select().where(*conditions).order_by(table.c.label)
+        if after is not None:
+            statement = statement.where(table.c.label > after)
+        if limit is not None:
+            # one more than the page to learn if another page follows
+            statement = statement.limit(limit + 1)
+        self.logger.debug("QUERY: %s", str(statement))
+        with self.engine.connect() as conn:
+            total = conn.execute(count).scalar()
+            contacts = [self._contact(row) for row in conn.execute(statement)]
+        more = limit is not None and len(contacts) > limit
+        if more:
+            contacts.pop()
+        self.logger.debug("RESULT: Fetched %d of %d contacts.", len(contacts), total)
+        return contacts, total, more
+
+    @staticmethod
+    def _contact(row):
+        """Convert a contacts row to a contact dict without the username"""
+        return {
+            "label": row["label"],
+            "account_num": row["account_num"],
+            "routing_num": row["routing_num"],
+            "is_external": row["is_external"],
+        }
+
+    def _select_contacts(self, username):
+        """Read the contacts of username from the database"""
         contacts = list()
+        # ordered, so the same contacts always make the same list and version
         statement = self.contacts_table.select().where(
             self.contacts_table.c.username == username
-        )
+        ).order_by(self.contacts_table.c.label)
         self.logger.debug("QUERY: %s", str(statement))
         with self.engine.connect() as conn:
             result = conn.execute(statement)
         for row in result:
-            contact = {
-                "label": row["label"],
-                "account_num": row["account_num"],
-                "routing_num": row["routing_num"],
-                "is_external": row["is_external"],
-            }
+            contact = self._contact(row)
             contacts.append(contact)
         self.logger.debug("RESULT: Fetched %d contacts.", len(contacts))
         return contacts
+
+    def listen_for_changes(self, retry_delay=5):
+        """Drop cached contacts lists that other replicas changed.
+
+        Starts a daemon thread that listens for the notifications sent by
+        add_contact. Does nothing unless notify is set.
+        """
+        if not self.notify:
+            return
+        # the listening connection is held for good, so it must not take
+        # one of the request pool's connections
+        listen_engine = create_engine(self.engine.url, poolclass=NullPool)
+        thread = threading.Thread(target=self._listen, args=(listen_engine, retry_delay),
+                                  name="contacts-changes", daemon=True)
+        thread.start()
+
+    def _listen(self, listen_engine, retry_delay):
+        """Invalidate cached lists as notifications arrive, reconnecting on errors"""
+        while True:
+            try:
+                connection = listen_engine.raw_connection()
+                try:
+                    self._receive_notifications(connection.connection)
+                finally:
+                    connection.close()
+            except Exception as err:  # pylint: disable=broad-except
+                self.logger.error("Error listening for contacts changes: %s", str(err))
+            # notifications may have been missed while disconnected
+            self.cache.clear()
+            time.sleep(retry_delay)
+
+    def _receive_notifications(self, dbapi_connection):
+        """Block on a psycopg2 connection, invalidating lists named in notifications"""
+        dbapi_connection.autocommit = True
+        with dbapi_connection.cursor() as cursor:
+            cursor.execute("LISTEN " + CHANGES_CHANNEL)
+        self.logger.info("Listening for contacts changes.")
+        while True:
+            if select.select([dbapi_connection], [], [], 60) == ([], [], []):
+                continue
+            dbapi_connection.poll()
+            while dbapi_connection.notifies:
+                notification = dbapi_connection.notifies.pop(0)
+                self.cache.invalidate(notification.payload)
@@ -0,0 +1,142 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+pool configures and measures the database connection pool
+"""
+
+import bisect
+import os
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+# upper bounds in seconds of the checkout wait histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+
+def engine_options(uri, environ=None):
+    """Return create_engine keyword arguments for the pool of uri.
+
+    Configured by environment variables:
+    DB_POOL_SIZE        connections kept open, by default GUNICORN_THREADS
+    DB_MAX_OVERFLOW     connections opened beyond DB_POOL_SIZE when busy
+    DB_POOL_TIMEOUT     seconds to wait for a free connection
+    DB_POOL_RECYCLE     seconds after which a connection is replaced
+    DB_POOL_PRE_PING    whether to test connections before handing them out
+
+    sqlite doesn't use a QueuePool, so it gets no options.
+    """
+    if uri.startswith("sqlite"):
+        return {}
+    environ = os.environ if environ is None else environ
+    threads = environ.get("GUNICORN_THREADS", "4")
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": int(environ.get("DB_POOL_SIZE", threads)),
+        "max_overflow": int(environ.get("DB_MAX_OVERFLOW", "2")),
+        "pool_timeout": float(environ.get("DB_POOL_TIMEOUT", "5")),
+        "pool_recycle": int(environ.get("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": environ.get("DB_POOL_PRE_PING", "true") == "true",
+    }
+
+
+class CheckoutStats:
+    """Histogram of how long connection checkouts waited, and how many timed out"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(WAIT_BUCKETS) + 1)
+        self.total = 0.0
+        self.timeouts = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        """Record a checkout that waited seconds"""
+        with self.lock:
+            self.buckets[bisect.bisect_left(WAIT_BUCKETS, seconds)] += 1
+            self.total += seconds
+
+    def timed_out(self):
+        """Record a checkout that gave up waiting"""
+        with self.lock:
+            self.timeouts += 1
+
+    def snapshot(self):
+        """Return (bucket counts, sum of waits, timeouts)"""
+        with self.lock:
+            return list(self.buckets), self.total, self.timeouts
+
+
+# one engine per process, and pools are recreated on dispose, so the
+# stats live outside the pool
+CHECKOUT_STATS = CheckoutStats()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        start = time.monotonic()
+        try:
+            connection = super()._do_get()
+        except PoolTimeout:
+            CHECKOUT_STATS.timed_out()
+            raise
+        CHECKOUT_STATS.observe(time.monotonic() - start)
+        return connection
+
+
+def pool_stats(engine):
+    """Return the size, in-use and overflow connection counts of engine's pool"""
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        # sqlite
+        return {"size": 0, "checked_out": 0, "overflow": 0}
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        # negative until the pool has opened pool_size connections
+        "overflow": max(0, pool.overflow()),
+    }
+
+
+def pool_metrics(stats, service):
+    """Return pool_stats and the checkout stats in the Prometheus text format"""
+    buckets, total, timeouts = CHECKOUT_STATS.snapshot()
+    lines = [
+        "# HELP db_pool_connections Database pool connections by state",
+        "# TYPE db_pool_connections gauge",
+        'db_pool_connections{{service="{}",state="size"}} {}'.format(service, stats["size"]),
+        'db_pool_connections{{service="{}",state="in_use"}} {}'.format(
+            service, stats["checked_out"]),
+        'db_pool_connections{{service="{}",state="overflow"}} {}'.format(
+            service, stats["overflow"]),
+        "# HELP db_pool_checkout_wait_seconds Time spent waiting for a pooled connection",
+        "# TYPE db_pool_checkout_wait_seconds histogram",
+    ]
+    cumulative = 0
+    for bound, count in zip(WAIT_BUCKETS + ("+Inf",), buckets):
+        cumulative += count
+        lines.append('db_pool_checkout_wait_seconds_bucket{{service="{}",le="{}"}} {}'.format(
+            service, bound, cumulative))
+    lines += [
+        'db_pool_checkout_wait_seconds_sum{{service="{}"}} {}'.format(service, total),
+        'db_pool_checkout_wait_seconds_count{{service="{}"}} {}'.format(service, cumulative),
+        "# HELP db_pool_checkout_timeouts_total Checkouts that gave up waiting for a connection",
+        "# TYPE db_pool_checkout_timeouts_total counter",
+        'db_pool_checkout_timeouts_total{{service="{}"}} {}'.format(service, timeouts),
+    ]
+    return "\n".join(lines) + "\n"
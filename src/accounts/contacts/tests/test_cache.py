@@ -0,0 +1,106 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for cache module
+"""
+
+import unittest
+from unittest.mock import MagicMock, patch
+
+from contacts.cache import ContactsCache
+
+
+class TestCache(unittest.TestCase):
+    """
+    Test cases for cache module
+    """
+
+    def setUp(self):
+        """Init a cache and a loader before each test"""
+        self.cache = ContactsCache(max_size=2, ttl=60)
+        self.load = MagicMock(side_effect=lambda username: [{"label": username}])
+
+    def test_get_loads_once_then_hits(self):
+        """test that a cached list is not loaded again"""
+        self.assertEqual([{"label": "foo"}], self.cache.get("foo", self.load))
+        self.assertEqual([{"label": "foo"}], self.cache.get("foo", self.load))
+        self.load.assert_called_once_with("foo")
+        stats = self.cache.stats()
+        self.assertEqual((1, 1), (stats["hits"], stats["misses"]))
+
+    def test_get_returns_copy(self):
+        """test that modifying a returned list doesn't modify the cache"""
+        self.cache.get("foo", self.load).append({"label": "bar"})
+        self.assertEqual([{"label": "foo"}], self.cache.get("foo", self.load))
+
+    def test_expired_entry_is_loaded_again(self):
+        """test that entries expire after ttl seconds"""
+        with patch("contacts.cache.time.monotonic", return_value=0):
+            self.cache.get("foo", self.load)
+        with patch("contacts.cache.time.monotonic", return_value=61):
+            self.cache.get("foo", self.load)
+        self.assertEqual(2, self.load.call_count)
+
+    def test_least_recently_used_is_evicted(self):
+        """test LRU eviction when the cache is full"""
+        self.cache.get("foo", self.load)
+        self.cache.get("bar", self.load)
+        self.cache.get("foo", self.load)
+        self.cache.get("baz", self.load)
+        self.assertEqual(1, self.cache.stats()["evictions"])
+        self.cache.get("foo", self.load)
+        self.cache.get("bar", self.load)
+        self.assertEqual(4, self.load.call_count)
+
+    def test_invalidate_drops_entry(self):
+        """test that an invalidated list is loaded again"""
+        self.cache.get("foo", self.load)
+        self.cache.invalidate("foo")
+        self.cache.get("foo", self.load)
+        self.assertEqual(2, self.load.call_count)
+        self.assertEqual(1, self.cache.stats()["invalidations"])
+
+    def test_invalidate_during_load_is_not_overwritten(self):
+        """test that a list read before a change isn't cached after it"""
+        def load_racing_write(username):
+            self.cache.invalidate(username)
+            return [{"label": "old"}]
+        self.assertEqual([{"label": "old"}], self.cache.get("foo", load_racing_write))
+        self.assertEqual([{"label": "foo"}], self.cache.get("foo", self.load))
+
+    def test_disabled_cache_always_loads(self):
+        """test that a cache of size 0 holds nothing"""
+        cache = ContactsCache(max_size=0)
+        cache.get("foo", self.load)
+        cache.get("foo", self.load)
+        self.assertEqual(2, self.load.call_count)
+        self.assertEqual(0, cache.stats()["size"])
+
+    def test_metrics_reports_hits_and_evictions(self):
+        """test the Prometheus text output"""
+        self.cache.get("foo", self.load)
+        self.cache.get("foo", self.load)
+        metrics = self.cache.metrics()
+        self.assertIn('contacts_cache_lookups_total{result="hit"} 1', metrics)
+        self.assertIn("contacts_cache_hit_ratio 0.5", metrics)
+        self.assertIn("contacts_cache_evictions_total 0", metrics)
+
+    def test_version_is_cached_and_changes_with_contents(self):
+        """test that a cached list keeps its version until invalidated"""
+        contacts, version = self.cache.get_versioned("foo", self.load)
+        self.assertEqual((contacts, version), self.cache.get_versioned("foo", self.load))
+        self.load.side_effect = lambda username: [{"label": username}, {"label": "new"}]
+        self.cache.invalidate("foo")
+        self.assertNotEqual(version, self.cache.get_versioned("foo", self.load)[1])
@@ -43,7 +43,7 @@ def create_new_contact(**kwargs):
     return example_contact
 
 
-class TestContacts(unittest.TestCase):
+class TestContacts(unittest.TestCase):  # pylint: disable=too-many-public-methods
     """
     Tests cases for contacts
     """
@@ -75,6 +75,140 @@ class TestContacts(unittest.TestCase):
                     self.flask_app.config["PUBLIC_KEY"] = EXAMPLE_PUBLIC_KEY
                     # mock return value of get_contacts to return empty
                     self.mocked_db.return_value.get_contacts.return_value = []
+                    self.mocked_db.return_value.get_contacts_versioned.return_value = (
+                        [], "v0"
+                    )
+
+    def test_metrics_endpoint_returns_cache_metrics(self):
+        """test that the contacts cache metrics are exported"""
+        response = self.test_app.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"contacts_cache_lookups_total", response.data)
+
+    def test_get_contacts_returns_full_list_with_total_count(self):
+        """test that the list without paging parameters comes from the cache"""
+        self.mocked_db.return_value.get_contacts_versioned.return_value = (
+            [EXAMPLE_CONTACT], "v1"
+        )
+        response = self.test_app.get(
+            "/contacts/{}".format(EXAMPLE_USER), headers=EXAMPLE_HEADERS
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), [EXAMPLE_CONTACT])
+        self.assertEqual(response.headers["X-Total-Count"], "1")
+        self.assertNotIn("X-Next-Cursor", response.headers)
+        self.mocked_db.return_value.search_contacts.assert_not_called()
+
+    def test_get_contacts_304_status_code_matching_etag(self):
+        """test revalidating the contacts list with its ETag"""
+        self.mocked_db.return_value.get_contacts_versioned.return_value = (
+            [EXAMPLE_CONTACT], "v1"
+        )
+        response = self.test_app.get(
+            "/contacts/{}".format(EXAMPLE_USER), headers=EXAMPLE_HEADERS
+        )
+        self.assertEqual(response.headers["ETag"], '"v1"')
+        headers = dict(EXAMPLE_HEADERS, **{"If-None-Match": response.headers["ETag"]})
+        response = self.test_app.get("/contacts/{}".format(EXAMPLE_USER), headers=headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+        # a new version gets the list again
+        self.mocked_db.return_value.get_contacts_versioned.return_value = (
+            [EXAMPLE_CONTACT, EXAMPLE_CONTACT], "v2"
+        )
+        response = self.test_app.get("/contacts/{}".format(EXAMPLE_USER), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["ETag"], '"v2"')
+
+    def test_get_contacts_304_status_code_weak_etag(self):
+        """test revalidating with the weak ETag a compressing proxy sends"""
+        self.mocked_db.return_value.get_contacts_versioned.return_value = (
+            [EXAMPLE_CONTACT], "v1"
+        )
+        headers = dict(EXAMPLE_HEADERS, **{"If-None-Match": 'W/"v1"'})
+        response = self.test_app.get("/contacts/{}".format(EXAMPLE_USER), headers=headers)
+        self.assertEqual(response.status_code, 304)
+
+    def test_get_contacts_page_round_trips_cursor(self):
+        """test that the next cursor of a page continues after its last label"""
+        self.mocked_db.return_value.search_contacts.return_value = (
+            [EXAMPLE_CONTACT], 3, True
+        )
+        response = self.test_app.get(
+            "/contacts/{}?limit=1&label_prefix=te".format(EXAMPLE_USER),
+            headers=EXAMPLE_HEADERS,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["X-Total-Count"], "3")
+        self.mocked_db.return_value.search_contacts.assert_called_with(
+            EXAMPLE_USER, label_prefix="te", limit=1
+        )
+        self.test_app.get(
+            "/contacts/{}?limit=1&cursor={}".format(
+                EXAMPLE_USER, response.headers["X-Next-Cursor"]
+            ),
+            headers=EXAMPLE_HEADERS,
+        )
+        self.mocked_db.return_value.search_contacts.assert_called_with(
+            EXAMPLE_USER, limit=1, after=EXAMPLE_CONTACT["label"]
+        )
+
+    def test_get_contacts_400_status_code_invalid_paging(self):
+        """test rejecting limits out of range and malformed cursors"""
+        for query in ("limit=0", "limit=foo", "limit=100000", "cursor=%21"):
+            response = self.test_app.get(
+                "/contacts/{}?{}".format(EXAMPLE_USER, query), headers=EXAMPLE_HEADERS
+            )
+            self.assertEqual(response.status_code, 400, query)
+
+    def test_add_contacts_201_status_code_adds_batch(self):
+        """test adding a batch of valid contacts"""
+        contacts = [create_new_contact(label="label {}".format(i),
+                                       account_num="{:010d}".format(i))
+                    for i in range(3)]
+        response = self.test_app.post(
+            "/contacts/{}/bulk".format(EXAMPLE_USER),
+            headers=EXAMPLE_HEADERS,
+            data=json.dumps(contacts),
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.get_json(), {"added": 3})
+        added = self.mocked_db.return_value.add_contacts.call_args[0][0]
+        self.assertEqual(["label 0", "label 1", "label 2"], [c["label"] for c in added])
+        self.assertTrue(all(c["username"] == EXAMPLE_USER for c in added))
+
+    def test_add_contacts_400_status_code_reports_every_invalid_row(self):
+        """test per-row errors for invalid, existing and repeated contacts"""
+        self.mocked_db.return_value.get_contacts.return_value = [create_new_contact()]
+        contacts = [
+            create_new_contact(label="new", account_num="1111111111"),
+            create_new_contact(label="other"),
+            create_new_contact(label="new", account_num="2222222222"),
+            create_new_contact(label="bad", account_num="123"),
+            create_new_contact(label="ok", account_num=1234567890),
+        ]
+        response = self.test_app.post(
+            "/contacts/{}/bulk".format(EXAMPLE_USER),
+            headers=EXAMPLE_HEADERS,
+            data=json.dumps(contacts),
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json(), {"errors": [
+            {"index": 1, "error": "account already exists as a contact"},
+            {"index": 2, "error": "contact already exists with that label"},
+            {"index": 3, "error": "invalid account number"},
+            {"index": 4, "error": "invalid contact"},
+        ]})
+        self.mocked_db.return_value.add_contacts.assert_not_called()
+
+    def test_add_contacts_400_status_code_not_a_list(self):
+        """test rejecting a body that isn't a list of contacts"""
+        response = self.test_app.post(
+            "/contacts/{}/bulk".format(EXAMPLE_USER),
+            headers=EXAMPLE_HEADERS,
+            data=json.dumps(create_new_contact()),
+        )
+        self.assertEqual(response.status_code, 400)
 
     def test_version_endpoint_returns_200_status_code_correct_version(self):
         """test if correct version is returned"""
@@ -138,10 +272,10 @@ class TestContacts(unittest.TestCase):
     def test_create_contact_409_status_code_duplicate_contact_with_diff_label(self,):
         """test adding a duplicate contact with same account_num
             and routing_num but different label"""
-        # mock return value of get_contacts to return default EXAMPLE_CONTACT
-        self.mocked_db.return_value.get_contacts.return_value = [
-            create_new_contact()
-        ]
+        # mock add_contact to report the unique constraint the contact violates
+        self.mocked_db.return_value.add_contact.side_effect = ValueError(
+            "account already exists as a contact"
+        )
         # create example contact request with new label
         duplicate_contact = create_new_contact(label="newlabel")
         # send request to test client
@@ -159,10 +293,10 @@ class TestContacts(unittest.TestCase):
 
     def test_create_contact_409_status_code_duplicate_contact_with_same_label(self,):
         """test adding a duplicate contact with same label, different account/routing num"""
-        # mock return value of get_contacts to return default EXAMPLE_CONTACT
-        self.mocked_db.return_value.get_contacts.return_value = [
-            create_new_contact()
-        ]
+        # mock add_contact to report the unique constraint the contact violates
+        self.mocked_db.return_value.add_contact.side_effect = ValueError(
+            "contact already exists with that label"
+        )
         # create example contact request with new account_num and routing_num
         duplicate_contact = create_new_contact(account_num="1231231231", routing_num="123123123")
         # send request to test client
@@ -282,17 +416,19 @@ class TestContacts(unittest.TestCase):
 
     def test_get_contacts_200_list_of_contacts(self):
         """test getting a list of contacts for a user"""
-        # mock return value of get_contacts to return two values
-        self.mocked_db.return_value.get_contacts.return_value = ["foo", "bar"]
+        # mock return value of get_contacts_versioned to return two values
+        self.mocked_db.return_value.get_contacts_versioned.return_value = (
+            ["foo", "bar"], "v1"
+        )
         # send request to test client
         response = self.test_app.get(
             "/contacts/{}".format(EXAMPLE_USER), headers=EXAMPLE_HEADERS
         )
         # assert 200 response code
         self.assertEqual(response.status_code, 200)
-        # assert get_contacts was called with the right args
+        # assert get_contacts_versioned was called with the right args
         self.assertEqual(
-            self.mocked_db.return_value.get_contacts.call_args[0][0],
+            self.mocked_db.return_value.get_contacts_versioned.call_args[0][0],
             EXAMPLE_USER,
         )
         # assert we get right number of contacts
@@ -318,8 +454,8 @@ class TestContacts(unittest.TestCase):
 
     def test_get_contacts_500_get_contacts_failure(self):
         """test getting contacts but throws SQL error"""
-        # mock return value of get_contacts to throw an error
-        self.mocked_db.return_value.get_contacts.side_effect = SQLAlchemyError()
+        # mock return value of get_contacts_versioned to throw an error
+        self.mocked_db.return_value.get_contacts_versioned.side_effect = SQLAlchemyError()
         # send request to test client
         response = self.test_app.get(
             "/contacts/{}".format(EXAMPLE_USER), headers=EXAMPLE_HEADERS
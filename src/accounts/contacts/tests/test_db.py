@@ -18,7 +18,11 @@ Tests for db module
 import random
 
 import unittest
+from unittest.mock import patch
 
+from sqlalchemy.pool import NullPool
+
+from contacts.cache import ContactsCache
 from contacts.db import ContactsDb
 from contacts.tests.constants import EXAMPLE_CONTACT_DB_OBJ
 
@@ -65,18 +69,128 @@ class TestDb(unittest.TestCase):
         num_contacts = random.randrange(40)
         for i in range(num_contacts):
             self.contact["label"] = "label-{}".format(i)
+            self.contact["account_num"] = "{:010d}".format(i)
             self.db.add_contact(self.contact)
             added_contacts.append(self.contact.copy())
         # get contact from db
         db_contact = self.db.get_contacts(self.contact["username"])
         # assert n contacts
         self.assertEqual(num_contacts, len(db_contact))
-        # assert list of contacts are equal
+        # assert list of contacts are equal, in any order
         for contact in added_contacts:
             contact.pop("username")
-        self.assertEqual(added_contacts, db_contact)
+        self.assertCountEqual(added_contacts, db_contact)
 
     def test_get_non_existent_contact_returns_empty(self):
         """test getting contacts for a non existent user"""
         # assert None when user does not exist
         self.assertEqual(0, len(self.db.get_contacts("baz")))
+
+    def test_add_duplicate_account_raises_value_error(self):
+        """test adding the same account twice under different labels"""
+        self.db.add_contact(self.contact)
+        self.contact["label"] = "other label"
+        with self.assertRaises(ValueError) as context:
+            self.db.add_contact(self.contact)
+        self.assertEqual("account already exists as a contact", str(context.exception))
+
+    def test_add_duplicate_label_raises_value_error(self):
+        """test adding two accounts under the same label"""
+        self.db.add_contact(self.contact)
+        self.contact["account_num"] = "1231231231"
+        with self.assertRaises(ValueError) as context:
+            self.db.add_contact(self.contact)
+        self.assertEqual("contact already exists with that label", str(context.exception))
+
+    def test_add_same_contact_for_different_users(self):
+        """test that uniqueness is per user"""
+        self.db.add_contact(self.contact)
+        self.contact["username"] = "bar"
+        self.db.add_contact(self.contact)
+        self.assertEqual(1, len(self.db.get_contacts("bar")))
+
+    def test_get_contacts_reads_through_cache(self):
+        """test that cached contacts lists are refreshed by add_contact"""
+        cache = ContactsCache()
+        self.db.cache = cache
+        self.db.add_contact(self.contact)
+        self.assertEqual(1, len(self.db.get_contacts(self.contact["username"])))
+        self.assertEqual(1, len(self.db.get_contacts(self.contact["username"])))
+        self.assertEqual(1, cache.stats()["hits"])
+        # adding a contact drops the cached list
+        self.contact["label"] = "other label"
+        self.contact["account_num"] = "1231231231"
+        self.db.add_contact(self.contact)
+        self.assertEqual(2, len(self.db.get_contacts(self.contact["username"])))
+
+    def test_search_contacts_pages_by_label(self):
+        """test walking the contacts of a user page by page"""
+        for i in range(5):
+            self.contact["label"] = "label {}".format(i)
+            self.contact["account_num"] = "{:010d}".format(i)
+            self.db.add_contact(self.contact)
+        username = self.contact["username"]
+        page, total, more = self.db.search_contacts(username, limit=2)
+        self.assertEqual(["label 0", "label 1"], [c["label"] for c in page])
+        self.assertEqual((5, True), (total, more))
+        page, total, more = self.db.search_contacts(username, after="label 3", limit=2)
+        self.assertEqual(["label 4"], [c["label"] for c in page])
+        self.assertEqual((5, False), (total, more))
+
+    def test_search_contacts_filters(self):
+        """test label prefix and account number search"""
+        for i, label in enumerate(["alice", "albert", "bob"]):
+            self.contact["label"] = label
+            self.contact["account_num"] = "{:010d}".format(i)
+            self.db.add_contact(self.contact)
+        username = self.contact["username"]
+        page, total, more = self.db.search_contacts(username, label_prefix="al")
+        self.assertEqual(["albert", "alice"], [c["label"] for c in page])
+        self.assertEqual((2, False), (total, more))
+        page, total, _ = self.db.search_contacts(username, account_num="0000000002")
+        self.assertEqual((["bob"], 1), ([c["label"] for c in page], total))
+        # LIKE wildcards in the prefix are matched literally
+        self.assertEqual(0, self.db.search_contacts(username, label_prefix="%")[1])
+
+    def test_add_contacts_adds_all(self):
+        """test adding several contacts at once"""
+        contacts = []
+        for i in range(3):
+            contacts.append(dict(self.contact, label="label {}".format(i),
+                                 account_num="{:010d}".format(i)))
+        self.db.add_contacts(contacts)
+        self.assertEqual(3, len(self.db.get_contacts(self.contact["username"])))
+
+    def test_add_contacts_conflict_adds_none(self):
+        """test that a conflict rolls back the whole batch"""
+        self.db.add_contact(self.contact)
+        contacts = [dict(self.contact, label="new label", account_num="1231231231"),
+                    dict(self.contact, account_num="3213213210")]
+        with self.assertRaises(ValueError) as context:
+            self.db.add_contacts(contacts)
+        self.assertEqual("contact already exists with that label", str(context.exception))
+        self.assertEqual(1, len(self.db.get_contacts(self.contact["username"])))
+
+    def test_contacts_version_changes_when_contact_added(self):
+        """test that add_contact gives the list a new version"""
+        self.db.cache = ContactsCache()
+        username = self.contact["username"]
+        self.db.add_contact(self.contact)
+        _, version = self.db.get_contacts_versioned(username)
+        self.assertEqual(version, self.db.get_contacts_versioned(username)[1])
+        self.contact["label"] = "other label"
+        self.contact["account_num"] = "1231231231"
+        self.db.add_contact(self.contact)
+        contacts, new_version = self.db.get_contacts_versioned(username)
+        self.assertEqual(2, len(contacts))
+        self.assertNotEqual(version, new_version)
+
+    def test_listen_for_changes_uses_own_connection(self):
+        """test that the change listener doesn't hold a request pool connection"""
+        self.db.notify = True
+        with patch("contacts.db.threading.Thread") as mock_thread:
+            self.db.listen_for_changes()
+        listen_engine = mock_thread.call_args[1]["args"][0]
+        self.assertIsNot(self.db.engine, listen_engine)
+        self.assertIsInstance(listen_engine.pool, NullPool)
+        mock_thread.return_value.start.assert_called_once_with()
@@ -21,6 +21,8 @@ import random
 from sqlalchemy import create_engine, MetaData, Table, Column, String, Date, LargeBinary
 from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
 
+from pool import engine_options, pool_stats
+
 class UserDb:
     """
     UserDb provides a set of helper functions over SQLAlchemy
@@ -28,7 +30,7 @@ class UserDb:
     """
 
     def __init__(self, uri, logger=logging):
-        self.engine = create_engine(uri)
+        self.engine = create_engine(uri, **engine_options(uri))
         self.logger = logger
         self.users_table = Table(
             'users',
@@ -52,6 +54,10 @@ class UserDb:
             service='users',
         )
 
+    def pool_stats(self):
+        """Return the size, in-use and overflow connection counts of the pool"""
+        return pool_stats(self.engine)
+
     def add_user(self, user):
         """Add a user to the database.
 
@@ -66,6 +66,16 @@ class TestUserservice(unittest.TestCase):
                     # create test client
                     self.test_app = self.flask_app.test_client()
 
+    def test_metrics_endpoint_returns_pool_metrics(self):
+        """test that the database pool metrics are exported"""
+        self.mocked_db.return_value.pool_stats.return_value = {
+            'size': 2, 'checked_out': 1, 'overflow': 0,
+        }
+        response = self.test_app.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'db_pool_connections{service="userservice",state="in_use"} 1',
+                      response.data)
+
     def test_version_endpoint_returns_200_status_code_correct_version(self):
         """test if correct version is returned"""
         # generate a version
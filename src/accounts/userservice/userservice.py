@@ -38,6 +38,7 @@ from opentelemetry.propagators.cloud_trace_propagator import CloudTraceFormatPro
 from opentelemetry.instrumentation.flask import FlaskInstrumentor
 
 from db import UserDb
+from pool import pool_metrics
 
 def create_app():
     """Flask application factory to create instances
@@ -63,6 +64,14 @@ def create_app():
         """
         return 'ok', 200
 
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """
+        Database pool metrics in the Prometheus text format
+        """
+        return (pool_metrics(users_db.pool_stats(), 'userservice'), 200,
+                {'Content-Type': 'text/plain; version=0.0.4'})
+
     @app.route('/users', methods=['POST'])
     def create_user():
         """Create a user record.
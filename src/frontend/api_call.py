@@ -14,18 +14,146 @@
 
 """API calls"""
 
-from requests import get
-from requests.exceptions import RequestException
+import asyncio
+import functools
+import hashlib
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import httpx
+from opentelemetry import trace
+from requests.exceptions import RequestException, Timeout
+
+from backend_guard import GUARDS
+from http_client import get_async_client
+from metrics import counter
+
+tracer = trace.get_tracer(__name__)
+
+DEADLINE_EXCEEDED = counter('frontend_backend_deadline_exceeded_total',
+                            'Backend calls cut short by the request deadline',
+                            labels=('backend',))
+HEDGES_SENT = counter('frontend_backend_hedges_sent_total',
+                      'Hedged second requests sent to a backend',
+                      labels=('backend',))
+HEDGES_WON = counter('frontend_backend_hedges_won_total',
+                     'Hedged second requests that answered first',
+                     labels=('backend',))
+COALESCED = counter('frontend_backend_coalesced_total',
+                    'Backend calls that shared an identical call already in flight',
+                    labels=('backend',))
+
+
+class Deadline:
+    """Point in time by which all backend calls for a request must finish"""
+
+    def __init__(self, seconds):
+        """Initialize a deadline seconds from now"""
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        """Seconds left before the deadline"""
+        return self.expires - time.monotonic()
+
+    def expired(self):
+        """Whether the deadline has passed"""
+        return self.remaining() <= 0
+
+
+class LatencyWindow:
+    """Latencies of the most recent successful calls to each backend"""
+
+    # calls observed before a backend's percentiles are trusted
+    MIN_SAMPLES = 20
+
+    def __init__(self, size=256):
+        """Initialize empty windows"""
+        self.size = size
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def observe(self, backend, seconds):
+        """Record the latency of a call to backend"""
+        with self.lock:
+            window = self.windows.get(backend)
+            if window is None:
+                window = self.windows[backend] = deque(maxlen=self.size)
+            window.append(seconds)
+
+    def percentile(self, backend, percentile):
+        """Return the given latency percentile for backend, or None if too few samples"""
+        with self.lock:
+            samples = sorted(self.windows.get(backend, ()))
+        if len(samples) < self.MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+
+LATENCIES = LatencyWindow()
+
+
+class SingleFlight:
+    """Lets concurrent identical calls on an event loop share one upstream request"""
+
+    def __init__(self):
+        """Initialize with no calls in flight"""
+        # (event loop, key) -> Future of the call in flight; a Future can
+        # only be awaited on its own loop
+        self.calls = {}
+
+    async def do(self, key, function, timeout):
+        """Await function(), or wait up to timeout seconds for the call already running for key.
+
+        Return: (result, shared) where shared tells whether another caller
+                made the request.
+        """
+        loop = asyncio.get_running_loop()
+        future = self.calls.get((loop, key))
+        if future is not None:
+            try:
+                # shielded, so a follower giving up doesn't cancel the leader's call
+                return await asyncio.wait_for(asyncio.shield(future), timeout), True
+            except asyncio.TimeoutError as err:
+                raise Timeout('timed out waiting for a shared request') from err
+
+        future = self.calls[(loop, key)] = loop.create_future()
+        try:
+            result = await function()
+            future.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            future.set_exception(Timeout('shared request was cancelled'))
+            raise
+        except Exception as err:
+            future.set_exception(err)
+            raise
+        finally:
+            del self.calls[(loop, key)]
+            # nobody may have been waiting for the result
+            if future.done() and not future.cancelled():
+                future.exception()
+
+
+FLIGHTS = SingleFlight()
 
 
 class ApiRequest:
     """Class for defining an API request"""
 
-    def __init__(self, url, headers, timeout):
-        """Initialize an API request"""
+    def __init__(self, url, headers, timeout, deadline=None, hedge_percentile=None):
+        """Initialize an API request
+
+        deadline          - optional Deadline shared by all calls of a request
+        hedge_percentile  - if set, send a second request when the first has
+                            not answered within this latency percentile
+        """
         self.url = url
         self.headers = headers
         self.timeout = timeout
+        self.deadline = deadline
+        self.hedge_percentile = hedge_percentile
 
 
 class ApiCall:
@@ -36,17 +164,102 @@ class ApiCall:
         self.display_name = display_name
         self.api_request = api_request
         self.logger = logger
+        self.backend = urlsplit(api_request.url).netloc
+        self.duration = None
 
-    def make_call(self):
-        """Making an API call"""
+    async def make_call(self):
+        """Making an API call on the running event loop"""
         response = None
+        start = time.perf_counter()
 
-        try:
-            response = get(url=self.api_request.url,
-                           headers=self.api_request.headers,
-                           timeout=self.api_request.timeout)
-        except (RequestException, ValueError) as err:
-            self.logger.error('Error getting %s: %s',
-                              self.display_name, str(err))
+        with tracer.start_as_current_span(self.display_name) as span:
+            span.set_attribute('backend', self.backend)
+            timeout = self.api_request.timeout
+            deadline = self.api_request.deadline
+            if deadline is not None:
+                timeout = min(timeout, deadline.remaining())
+                if timeout <= 0:
+                    DEADLINE_EXCEEDED.inc(backend=self.backend)
+                    span.set_attribute('deadline_exceeded', True)
+                    self.logger.error('Error getting %s: deadline exceeded',
+                                      self.display_name)
+                    return None
+            try:
+                response, shared = await FLIGHTS.do(self._flight_key(),
+                                                    lambda: self._fetch(timeout, span),
+                                                    timeout)
+                if shared:
+                    COALESCED.inc(backend=self.backend)
+                    span.set_attribute('coalesced', True)
+                span.set_attribute('http.status_code', response.status_code)
+            except (httpx.HTTPError, RequestException, ValueError) as err:
+                span.set_attribute('error', True)
+                if deadline is not None and deadline.expired():
+                    DEADLINE_EXCEEDED.inc(backend=self.backend)
+                    span.set_attribute('deadline_exceeded', True)
+                self.logger.error('Error getting %s: %s',
+                                  self.display_name, str(err))
 
+        self.duration = time.perf_counter() - start
         return response
+
+    def _flight_key(self):
+        """Identify calls that may share a response: same URL, same credentials"""
+        authorization = self.api_request.headers.get('Authorization', '')
+        return (self.api_request.url,
+                hashlib.sha256(authorization.encode('utf-8')).hexdigest())
+
+    async def _fetch(self, timeout, span):
+        """Send the request, hedged if configured, unless the backend's guard rejects it"""
+        if self.api_request.hedge_percentile is not None:
+            send = functools.partial(self._hedged_get, timeout, span)
+        else:
+            send = functools.partial(self._get, timeout)
+        return await GUARDS.get(self.backend).call(self.backend, send,
+                                                   LATENCIES.percentile(self.backend, 50))
+
+    async def _get(self, timeout):
+        """Send the request once and record its latency"""
+        start = time.monotonic()
+        response = await get_async_client().get(url=self.api_request.url,
+                                                headers=self.api_request.headers,
+                                                timeout=timeout)
+        LATENCIES.observe(self.backend, time.monotonic() - start)
+        return response
+
+    async def _hedged_get(self, timeout, span):
+        """Send the request, and a second one if the first is slower than usual.
+
+        Returns whichever response arrives first and cancels the other.
+        Only used for idempotent GETs.
+        """
+        delay = LATENCIES.percentile(self.backend, self.api_request.hedge_percentile)
+        if delay is None or delay >= timeout:
+            return await self._get(timeout)
+
+        start = time.monotonic()
+        attempts = [asyncio.ensure_future(self._get(timeout))]
+        pending = set(attempts)
+        error = None
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=delay)
+            if not done:
+                HEDGES_SENT.inc(backend=self.backend)
+                span.set_attribute('hedged', True)
+                attempts.append(asyncio.ensure_future(
+                    self._get(timeout - (time.monotonic() - start))))
+                pending.add(attempts[1])
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is not None:
+                        error = future.exception()
+                        continue
+                    if len(attempts) > 1 and future is attempts[1]:
+                        HEDGES_WON.inc(backend=self.backend)
+                    return future.result()
+            raise error
+        finally:
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,222 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per-backend concurrency limits and circuit breakers"""
+
+import os
+import threading
+import time
+
+from requests.exceptions import RequestException
+
+from metrics import collector, counter
+
+REJECTED = counter('frontend_backend_rejected_total',
+                   'Backend calls failed fast without being sent',
+                   labels=('backend', 'reason'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class BackendUnavailable(RequestException):
+    """Raised instead of sending a call that a guard rejected"""
+
+
+class AdaptiveLimit:
+    """Concurrency limit adjusted by additive increase, multiplicative decrease.
+
+    Each call that succeeds in reasonable time raises the limit by
+    1/limit, i.e. by about one per limit's worth of calls. A call that
+    fails, or takes longer than tolerance times the backend's median
+    latency, cuts the limit by backoff. Calls over the limit are rejected.
+    """
+
+    def __init__(self, initial=20, minimum=1, maximum=100, backoff=0.9, tolerance=2.0):
+        """Initialize a limit"""
+        self.limit = float(initial)
+        self.bounds = (minimum, maximum)
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        """Take a slot for a call, or return False if the limit is reached"""
+        with self.lock:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def cancel(self):
+        """Return the slot of a call that was not sent"""
+        with self.lock:
+            self.in_flight -= 1
+
+    def release(self, ok, latency, median):
+        """Return the slot of a finished call and adjust the limit"""
+        with self.lock:
+            self.in_flight -= 1
+            if not ok or (median is not None and latency > median * self.tolerance):
+                self.limit = max(self.bounds[0], self.limit * self.backoff)
+            else:
+                self.limit = min(self.bounds[1], self.limit + 1 / self.limit)
+
+
+class CircuitBreaker:
+    """Stops calls to a backend after consecutive failures.
+
+    After failure_threshold failures in a row the circuit opens and calls
+    are rejected. After reset_timeout seconds one trial call is let
+    through (half open); its success closes the circuit, its failure
+    opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=10):
+        """Initialize a closed circuit"""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may be sent now"""
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                return True
+            # open, or half open with the trial call still running
+            return False
+
+    def record(self, ok):
+        """Record the outcome of a call that was allowed"""
+        with self.lock:
+            if ok:
+                self.state = CLOSED
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+
+class BackendGuard:
+    """Concurrency limit and circuit breaker for one backend"""
+
+    def __init__(self, limit, breaker):
+        """Initialize a guard"""
+        self.limit = limit
+        self.breaker = breaker
+
+    async def call(self, backend, function, median):
+        """Await function() if the backend can take it, else raise BackendUnavailable.
+
+        A response with a 5xx status or an exception counts as a failure.
+        median is the backend's recent median latency, or None.
+        """
+        if not self.limit.try_acquire():
+            REJECTED.inc(backend=backend, reason='concurrency_limit')
+            raise BackendUnavailable(f'concurrency limit reached for {backend}')
+        if not self.breaker.allow():
+            self.limit.cancel()
+            REJECTED.inc(backend=backend, reason='circuit_open')
+            raise BackendUnavailable(f'circuit open for {backend}')
+
+        ok = False
+        start = time.monotonic()
+        try:
+            response = await function()
+            ok = response.status_code < 500
+            return response
+        finally:
+            self.limit.release(ok, time.monotonic() - start, median)
+            self.breaker.record(ok)
+
+
+class BackendGuards:
+    """Process-wide registry of per-backend guards"""
+
+    def __init__(self, initial_limit=20, max_limit=100, failure_threshold=5, reset_timeout=10):
+        """Initialize an empty registry"""
+        self.initial_limit = initial_limit
+        self.max_limit = max_limit
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.guards = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Create a registry configured from environment variables
+
+        BACKEND_CONCURRENCY_LIMIT   initial concurrent calls allowed per backend
+        BACKEND_MAX_CONCURRENCY     upper bound the limit may grow to
+        BACKEND_CIRCUIT_FAILURES    consecutive failures that open a circuit
+        BACKEND_CIRCUIT_RESET       seconds before an open circuit is tried again
+        """
+        return cls(initial_limit=int(os.getenv('BACKEND_CONCURRENCY_LIMIT', '20')),
+                   max_limit=int(os.getenv('BACKEND_MAX_CONCURRENCY', '100')),
+                   failure_threshold=int(os.getenv('BACKEND_CIRCUIT_FAILURES', '5')),
+                   reset_timeout=float(os.getenv('BACKEND_CIRCUIT_RESET', '10')))
+
+    def get(self, backend):
+        """Return the guard for backend, creating it if needed"""
+        with self.lock:
+            guard = self.guards.get(backend)
+            if guard is None:
+                guard = BackendGuard(AdaptiveLimit(initial=self.initial_limit,
+                                                   maximum=self.max_limit),
+                                     CircuitBreaker(self.failure_threshold,
+                                                    self.reset_timeout))
+                self.guards[backend] = guard
+            return guard
+
+    def stats(self):
+        """Return limit, in-flight calls and circuit state keyed by backend"""
+        with self.lock:
+            guards = dict(self.guards)
+        return {backend: {'limit': int(guard.limit.limit),
+                          'in_flight': guard.limit.in_flight,
+                          'circuit': guard.breaker.state}
+                for backend, guard in guards.items()}
+
+
+GUARDS = BackendGuards.from_env()
+
+
+@collector('frontend_backend_concurrency', 'gauge',
+           'Adaptive concurrency limit and calls in flight per backend')
+def _concurrency():
+    """Export the concurrency limit of each backend"""
+    samples = []
+    for backend, stats in GUARDS.stats().items():
+        samples.append(({'backend': backend, 'stat': 'limit'}, stats['limit']))
+        samples.append(({'backend': backend, 'stat': 'in_flight'}, stats['in_flight']))
+    return samples
+
+
+@collector('frontend_backend_circuit_state', 'gauge',
+           'Circuit breaker state per backend, 1 for the current state')
+def _circuit_state():
+    """Export the circuit state of each backend"""
+    return [({'backend': backend, 'state': state}, int(stats['circuit'] == state))
+            for backend, stats in GUARDS.stats().items()
+            for state in (CLOSED, HALF_OPEN, OPEN)]
@@ -0,0 +1,95 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Parsing and validation of batch payment requests"""
+
+import csv
+import io
+import json
+import uuid
+from decimal import Decimal, DecimalException
+
+REQUIRED_FIELDS = ('account_num', 'amount')
+
+# the ledger stores amounts in cents as 32-bit integers
+MAX_AMOUNT = 2 ** 31 - 1
+
+
+def to_cents(user_input):
+    """Convert a decimal number of dollars to cents.
+
+    Raise: ValueError if user_input is not a finite number or the amount is
+           more than the ledger can store
+    """
+    try:
+        dollars = Decimal(user_input)
+        if not dollars.is_finite():
+            raise ValueError('{} is not a valid number'.format(user_input))
+        if dollars * 100 > MAX_AMOUNT:
+            raise ValueError('amount must be at most {:.2f}'.format(Decimal(MAX_AMOUNT) / 100))
+        return int(dollars * 100)
+    except DecimalException as num_err:
+        # exponents too large for the decimal context overflow when scaled
+        raise ValueError('{} is not a valid number'.format(user_input)) from num_err
+
+
+def parse_payments(body, content_type):
+    """Parse a batch of payments sent as a JSON list or as CSV with a header row.
+
+    Return: a list of dicts with at least account_num and amount
+    Raise: ValueError if the document can't be parsed
+    """
+    if content_type == 'application/json':
+        rows = json.loads(body)
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError('expected a JSON list of payment objects')
+        return rows
+    reader = csv.DictReader(io.StringIO(body))
+    missing = [field for field in REQUIRED_FIELDS if field not in (reader.fieldnames or ())]
+    if missing:
+        raise ValueError('CSV header is missing {}'.format(', '.join(missing)))
+    return list(reader)
+
+
+def validate_payments(rows, batch_id=None):
+    """Check every payment of a batch before any is submitted.
+
+    Amounts follow the same rule as single payments: a decimal number of
+    dollars converted to cents by to_cents. A payment without a uuid gets one derived
+    from batch_id and its position, so resubmitting the same batch with the
+    same batch_id doesn't pay twice. Without a batch_id, a random one is used.
+
+    Return: (payments, errors). payments holds account_num, amount in cents
+            and uuid for every row; errors holds the index and reason of
+            every invalid row.
+    """
+    namespace = uuid.uuid5(uuid.NAMESPACE_URL, batch_id) if batch_id else uuid.uuid4()
+    payments = []
+    errors = []
+    for index, row in enumerate(rows):
+        account_num = str(row.get('account_num') or '').strip()
+        user_input = str(row.get('amount') or '').strip()
+        try:
+            if not account_num:
+                raise ValueError('missing account_num')
+            amount = to_cents(user_input)
+            if amount <= 0:
+                raise ValueError('amount must be positive')
+        except ValueError as err:
+            errors.append({'index': index, 'error': str(err)})
+            continue
+        payments.append({'account_num': account_num,
+                         'amount': amount,
+                         'uuid': str(row.get('uuid') or uuid.uuid5(namespace, str(index)))})
+    return payments, errors
@@ -0,0 +1,103 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark page rendering with and without the shared fragment cache.
+
+Usage (from src/frontend): python benchmarks/render_templates.py [iterations]
+"""
+
+import os
+import sys
+import timeit
+
+from flask import Flask, render_template
+from jinja2 import pass_context
+from markupsafe import Markup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# pylint: disable=wrong-import-position
+from fragments import FragmentCache
+
+POD_CONTEXT = {
+    'bank_name': 'Bank of Anthos',
+    'cluster_name': 'bank-of-anthos',
+    'cymbal_logo': 'false',
+    'platform': 'gcp',
+    'platform_display_name': 'Google Cloud',
+    'pod_name': 'frontend-7c9f8d6b5-abcde',
+    'pod_zone': 'us-central1-b',
+}
+
+HISTORY = [{'fromAccountNum': '1011226111', 'fromRoutingNum': '883745000',
+            'toAccountNum': '1033623433', 'toRoutingNum': '883745000',
+            'amount': 1000 + i, 'timestamp': '2024-03-01T10:00:00.000+0000',
+            'accountLabel': 'Alice', 'displayMonth': 'Mar', 'displayDay': '01'}
+           for i in range(100)]
+
+CONTACTS = [{'label': 'Alice', 'account_num': '1033623433',
+             'routing_num': '883745000', 'is_external': False},
+            {'label': 'External', 'account_num': '9099791699',
+             'routing_num': '808889588', 'is_external': True}]
+
+PAGES = {
+    'index.html': dict(POD_CONTEXT, account_id='1011226111', balance=12345,
+                       contacts=CONTACTS, history=HISTORY, history_cursor=None,
+                       history_next_cursor=None, history_size=None, message=None,
+                       name='Test User', stale={}),
+    'login.html': dict(POD_CONTEXT, app_name=None, default_password='',
+                       default_user='', message=None, redirect_uri=None,
+                       response_type=None, state=None),
+    'signup.html': POD_CONTEXT,
+}
+
+
+def create_app(cached):
+    """Create a Flask app with the frontend templates and globals"""
+    app = Flask('frontend', template_folder=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '..', 'templates'))
+    app.jinja_env.globals.update(format_currency=lambda amount: '$---',
+                                 format_timestamp_month=lambda timestamp: 'Mar',
+                                 format_timestamp_day=lambda timestamp: '01',
+                                 static_url=lambda name: f'static/{name}')
+    if cached:
+        FragmentCache(app.jinja_env).register()
+    else:
+        # equivalent of a plain {% include %}: render the partial every time
+        @pass_context
+        def fragment(context, template_name):
+            return Markup(app.jinja_env.get_template(template_name).render(context))
+        app.jinja_env.globals.update(fragment=fragment)
+    return app
+
+
+def main():
+    """Print the best mean render time of each page, uncached vs cached"""
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    print('{:<12} {:>14} {:>14} {:>8}'.format('page', 'uncached (ms)', 'cached (ms)', 'speedup'))
+    for page, context in PAGES.items():
+        timings = []
+        for cached in (False, True):
+            app = create_app(cached)
+            with app.test_request_context('/'):
+                render_template(page, **context)  # warm template and fragment caches
+                seconds = min(timeit.repeat(
+                    lambda page=page, context=context: render_template(page, **context),
+                    number=iterations, repeat=5))
+            timings.append(seconds * 1000 / iterations)
+        print('{:<12} {:>14.3f} {:>14.3f} {:>7.2f}x'.format(
+            page, timings[0], timings[1], timings[0] / timings[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-process caches for backend data"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire ttl seconds after they are set.
+
+    A value read from a backend can race an invalidation of the same key:
+    read generation before fetching and pass it to set, which then doesn't
+    put back a value that was invalidated in the meantime.
+    """
+
+    def __init__(self, max_size, ttl):
+        """Initialize an empty cache"""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        # bumped by every invalidation
+        self.generation = 0
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self.counters['misses'] += 1
+            return None
+
+    def set(self, key, value, generation=None):
+        """Cache value under key, evicting the least recently used entries.
+
+        If generation is given and an invalidation happened since it was
+        read, value may be out of date and isn't cached.
+        """
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def invalidate(self, key):
+        """Drop the cached value for key"""
+        with self.lock:
+            self.generation += 1
+            if self.entries.pop(key, None) is not None:
+                self.counters['invalidations'] += 1
+
+    def stats(self):
+        """Return cache size and hit/miss counters"""
+        with self.lock:
+            return dict(self.counters, size=len(self.entries))
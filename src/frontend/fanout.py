@@ -0,0 +1,126 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Asyncio aggregation of concurrent backend calls"""
+
+import asyncio
+import functools
+import os
+import threading
+
+from opentelemetry import context as otel_context
+
+# calls left running after a soft timeout; the event loop only keeps weak
+# references to its tasks
+_LATE = set()
+
+
+async def gather_calls(api_calls, api_response, soft_timeout=None, on_late=None, context=None):
+    """Run api_calls concurrently on the running event loop and wait for them.
+
+    The JSON body of each successful call is stored in api_response under
+    the call's display_name. A failed call leaves its default value in place.
+
+    If soft_timeout is set, calls whose display_name is a key of on_late and
+    that haven't finished after soft_timeout seconds are left running: their
+    default value is returned, and on_late[display_name] is called with the
+    JSON body once they succeed.
+
+    ASGI handlers can await this directly; Flask views call aggregate.
+    context is the trace context to make the calls in, by default the current one.
+    """
+    token = otel_context.attach(context) if context is not None else None
+    try:
+        # tasks copy the context they are created in
+        tasks = {asyncio.ensure_future(_body(api_call)): api_call for api_call in api_calls}
+    finally:
+        if token is not None:
+            otel_context.detach(token)
+
+    on_late = on_late or {}
+    late = set()
+    if soft_timeout is not None and tasks:
+        _, pending = await asyncio.wait(tasks, timeout=soft_timeout)
+        late = {task for task in pending if tasks[task].display_name in on_late}
+        for task in late:
+            _LATE.add(task)
+            task.add_done_callback(
+                functools.partial(_late_result, on_late[tasks[task].display_name]))
+    waiting = [task for task in tasks if task not in late]
+    if waiting:
+        await asyncio.wait(waiting)
+
+    for task, api_call in tasks.items():
+        if task not in late and task.result() is not None:
+            api_response[api_call.display_name] = task.result()
+    return api_response
+
+
+async def _body(api_call):
+    """Make api_call and return its JSON body, or None if it failed"""
+    response = await api_call.make_call()
+    return response.json() if response is not None and not response.is_error else None
+
+
+def _late_result(callback, task):
+    """Pass the body of a call that finished after the soft timeout to callback"""
+    _LATE.discard(task)
+    if not task.cancelled() and task.exception() is None and task.result() is not None:
+        callback(task.result())
+
+
+class FanOutLoop:
+    """Event loop running on a background thread, shared by WSGI request threads"""
+
+    def __init__(self):
+        """Initialize and start the loop"""
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever,
+                                       name='fanout-loop',
+                                       daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine):
+        """Run coroutine on the loop and block until it completes"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+
+_LOOP = None
+_LOOP_PID = None
+_LOOP_LOCK = threading.Lock()
+
+
+def get_loop():
+    """Return the process-wide fan-out event loop.
+
+    The loop is created lazily, so every gunicorn worker runs its own.
+    """
+    global _LOOP, _LOOP_PID  # pylint: disable=global-statement
+    with _LOOP_LOCK:
+        if _LOOP is None or _LOOP_PID != os.getpid():
+            _LOOP = FanOutLoop()
+            _LOOP_PID = os.getpid()
+        return _LOOP
+
+
+def aggregate(api_calls, api_response, soft_timeout=None, on_late=None):
+    """Blocking entry point for Flask views; see gather_calls.
+
+    The calls of every request thread of the worker share one event loop,
+    and run in the trace context of the calling request.
+    """
+    return get_loop().run(gather_calls(api_calls, api_response,
+                                       soft_timeout=soft_timeout,
+                                       on_late=on_late,
+                                       context=otel_context.get_current()))
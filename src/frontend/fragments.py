@@ -0,0 +1,83 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cache of rendered shared template partials"""
+
+import threading
+from collections import OrderedDict
+
+from jinja2 import meta, pass_context
+from markupsafe import Markup
+
+_MISSING = object()
+
+
+class FragmentCache:
+    """Renders partials under templates/shared/ once per set of inputs.
+
+    The inputs of a partial are the variables its source reads, such as
+    cluster_name or bank_name. Their values are taken from the context of
+    the page that includes the partial and form the cache key, so a
+    partial is re-rendered only when one of them changes.
+
+    Pages include a cached partial with {{ fragment('shared/footer.html') }}.
+    Only partials whose inputs are the same for every user belong here;
+    one that reads a per-user variable, like navigation.html reads name,
+    would take an entry per user and churn the cache, so it is included
+    with a plain {% include %} instead.
+    """
+
+    def __init__(self, jinja_env, max_size=256):
+        """Initialize an empty cache for templates loaded by jinja_env"""
+        self.jinja_env = jinja_env
+        self.max_size = max_size
+        self.inputs = {}
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _inputs(self, template_name):
+        """Return the names of the variables read by a partial"""
+        names = self.inputs.get(template_name)
+        if names is None:
+            source = self.jinja_env.loader.get_source(self.jinja_env, template_name)[0]
+            names = tuple(sorted(meta.find_undeclared_variables(self.jinja_env.parse(source))))
+            self.inputs[template_name] = names
+        return names
+
+    def render(self, template_name, context):
+        """Return the partial rendered with its inputs from context"""
+        values = tuple(context.get(name, _MISSING) for name in self._inputs(template_name))
+        key = (template_name, values)
+        with self.lock:
+            markup = self.entries.get(key)
+            if markup is not None:
+                self.entries.move_to_end(key)
+                return markup
+
+        # variables missing from the page stay undefined in the partial
+        markup = Markup(self.jinja_env.get_template(template_name).render(
+            {name: value for name, value in zip(self._inputs(template_name), values)
+             if value is not _MISSING}))
+        with self.lock:
+            self.entries[key] = markup
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return markup
+
+    def register(self):
+        """Expose the cache to templates as the fragment() global"""
+        @pass_context
+        def fragment(context, template_name):
+            return self.render(template_name, context)
+        self.jinja_env.globals.update(fragment=fragment)
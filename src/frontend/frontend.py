@@ -16,20 +16,20 @@
 """
 
 # Module imports
-import concurrent.futures
 import datetime
+import functools
+import hashlib
 import json
 import logging
 import os
 import socket
 from decimal import Decimal, DecimalException
-from time import sleep
 
 import requests
 from requests.exceptions import HTTPError, RequestException
 import jwt
-from flask import Flask, abort, jsonify, make_response, redirect, \
-    render_template, request, url_for
+from flask import Flask, Response, abort, g, jsonify, make_response, redirect, \
+    render_template, request, stream_template, url_for
 
 from opentelemetry import trace
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
@@ -38,12 +38,27 @@ from opentelemetry.propagate import set_global_textmap
 from opentelemetry.exporter.cloud_trace import CloudTraceSpanExporter
 from opentelemetry.propagators.cloud_trace_propagator import CloudTraceFormatPropagator
 from opentelemetry.instrumentation.flask import FlaskInstrumentor
+from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
 from opentelemetry.instrumentation.requests import RequestsInstrumentor
 from opentelemetry.instrumentation.jinja2 import Jinja2Instrumentor
 
 # Local imports
-from api_call import ApiCall, ApiRequest
-from traced_thread_pool_executor import TracedThreadPoolExecutor
+from api_call import ApiCall, ApiRequest, Deadline
+from batch import parse_payments, to_cents, validate_payments
+from cache import TTLCache
+from fragments import FragmentCache
+from history import paginate_history
+from http_client import get_client
+from last_known_good import LastKnownGood, format_age
+from metadata import InstanceMetadata
+from metrics import collector
+from pending import PendingTransactions
+from request_metrics import instrument
+from response_compression import Compressor
+from static_assets import StaticAssets
+from token_cache import VerifiedClaimsCache
+from traced_thread_pool_executor import get_executor
+from fanout import aggregate
 
 # Local constants
 BALANCE_NAME = "balance"
@@ -61,6 +76,9 @@ def create_app():
     # Disabling unused-variable for lines with route decorated functions
     # as pylint thinks they are unused
     # pylint: disable=unused-variable
+    # request latency metrics, Server-Timing headers and /metrics
+    instrument(app)
+
     @app.route('/version', methods=['GET'])
     def version():
         """
@@ -81,7 +99,8 @@ def create_app():
         Returns the cluster name + zone name where this Pod is running.
 
         """
-        return "Cluster: " + cluster_name + ", Pod: " + pod_name + ", Zone: " + pod_zone, 200
+        return ("Cluster: " + instance_metadata.cluster_name + ", Pod: " + pod_name
+                + ", Zone: " + instance_metadata.pod_zone), 200
 
     @app.route("/")
     def root():
@@ -99,76 +118,167 @@ def create_app():
         Renders home page. Redirects to /login if token is not valid
         """
         token = request.cookies.get(app.config['TOKEN_NAME'])
-        if not verify_token(token):
+        token_data = verify_token(token)
+        if not token_data:
             # user isn't authenticated
             app.logger.debug('User isn\'t authenticated. Redirecting to login page.')
             return redirect(url_for('login_page',
                                     _external=True,
                                     _scheme=app.config['SCHEME']))
-        token_data = decode_token(token)
         display_name = token_data['name']
+        account_id = token_data['acct']
+        api_response = _fetch_dashboard(token, token_data)
+
+        history_size = request.args.get('history_size', type=int)
+        history, next_cursor = paginate_history(
+            api_response[TRANSACTION_LIST_NAME],
+            request.args.get('history_cursor', type=int),
+            max(1, min(history_size or app.config['HISTORY_PAGE_SIZE'],
+                       app.config['HISTORY_MAX_PAGE_SIZE'])))
+
+        _populate_contact_labels(account_id, history, api_response[CONTACTS_NAME])
+        _populate_display_dates(history)
+
+        return _render_page('index.html',
+                            account_id=account_id,
+                            balance=api_response[BALANCE_NAME],
+                            bank_name=os.getenv('BANK_NAME', 'Bank of Anthos'),
+                            cluster_name=instance_metadata.cluster_name,
+                            contacts=api_response[CONTACTS_NAME],
+                            cymbal_logo=os.getenv('CYMBAL_LOGO', 'false'),
+                            history=history,
+                            history_cursor=request.args.get('history_cursor', type=int),
+                            history_next_cursor=next_cursor,
+                            history_size=history_size,
+                            stale=api_response['stale'],
+                            message=request.args.get('msg', None),
+                            name=display_name,
+                            platform=platform,
+                            platform_display_name=platform_display_name,
+                            pod_name=pod_name,
+                            pod_zone=instance_metadata.pod_zone)
+
+    @app.route('/api/dashboard', methods=['GET'])
+    def dashboard():
+        """
+        Returns the balance, transaction history and contacts shown on /home
+        as JSON. The token is read from the login cookie or a bearer
+        Authorization header.
+
+        The response carries an ETag of its content; a request whose
+        If-None-Match matches it gets an empty 304.
+        """
+        token = _request_token()
+        token_data = verify_token(token)
+        if not token_data:
+            return abort(401)
+
+        api_response = _fetch_dashboard(token, token_data)
+        body = json.dumps(api_response, sort_keys=True, separators=(',', ':'))
+        resp = Response(body, mimetype='application/json')
+        resp.set_etag(hashlib.sha256(body.encode('utf-8')).hexdigest()[:32])
+        # per user, and always revalidated so new transactions show up
+        resp.headers['Cache-Control'] = 'private, no-cache'
+        return resp.make_conditional(request)
+
+    def _request_token():
+        """Return the token from the login cookie, or else a bearer Authorization header"""
+        token = request.cookies.get(app.config['TOKEN_NAME'])
+        auth_header = request.headers.get('Authorization', '')
+        if token is None and auth_header.startswith('Bearer '):
+            token = auth_header[len('Bearer '):]
+        return token
+
+    def _fetch_dashboard(token, token_data):
+        """
+        Fetches the balance, transaction history and contacts of a user
+        concurrently, with pending transactions from this pod merged in.
+
+        Params: token - the user's raw token
+                token_data - the verified claims of token
+        Return: a dict of the balance, the transaction list (newest first)
+                and the contacts. Values that could not be fetched are None,
+                except contacts which default to an empty list. If an
+                earlier value of the balance or history is served instead,
+                'stale' maps its name to the epoch time it was fetched.
+        """
         username = token_data['user']
         account_id = token_data['acct']
 
         hed = {'Authorization': 'Bearer ' + token}
-
-        api_calls = [
-            # get balance
-            ApiCall(display_name=BALANCE_NAME,
-                    api_request=ApiRequest(url=f'{app.config["BALANCES_URI"]}/{account_id}',
-                                           headers=hed,
-                                           timeout=app.config['BACKEND_TIMEOUT']),
-                    logger=app.logger),
-            # get history
-            ApiCall(display_name=TRANSACTION_LIST_NAME,
-                    api_request=ApiRequest(url=f'{app.config["HISTORY_URI"]}/{account_id}',
-                                           headers=hed,
-                                           timeout=app.config['BACKEND_TIMEOUT']),
-                    logger=app.logger),
-            # get contacts
-            ApiCall(display_name=CONTACTS_NAME,
-                    api_request=ApiRequest(url=f'{app.config["CONTACTS_URI"]}/{username}',
-                                           headers=hed,
-                                           timeout=app.config['BACKEND_TIMEOUT']),
-                    logger=app.logger)
-        ]
-
-        api_response = {BALANCE_NAME: None,
-                        TRANSACTION_LIST_NAME: None,
-                        CONTACTS_NAME: []}
-
-        tracer = trace.get_tracer(__name__)
-        with TracedThreadPoolExecutor(tracer, max_workers=3) as executor:
-            futures = []
-
-            future_to_api_call = {
-                executor.submit(api_call.make_call):
-                    api_call for api_call in api_calls
-            }
-
-            for future in concurrent.futures.as_completed(future_to_api_call):
-                if future.result():
-                    api_call = future_to_api_call[future]
-                    api_response[api_call.display_name] = future.result().json()
-
-        _populate_contact_labels(account_id,
-                                 api_response[TRANSACTION_LIST_NAME],
-                                 api_response[CONTACTS_NAME])
-
-        return render_template('index.html',
-                               account_id=account_id,
-                               balance=api_response[BALANCE_NAME],
-                               bank_name=os.getenv('BANK_NAME', 'Bank of Anthos'),
-                               cluster_name=cluster_name,
-                               contacts=api_response[CONTACTS_NAME],
-                               cymbal_logo=os.getenv('CYMBAL_LOGO', 'false'),
-                               history=api_response[TRANSACTION_LIST_NAME],
-                               message=request.args.get('msg', None),
-                               name=display_name,
-                               platform=platform,
-                               platform_display_name=platform_display_name,
-                               pod_name=pod_name,
-                               pod_zone=pod_zone)
+        # one deadline shared by every backend call made for this request
+        deadline = Deadline(app.config['HOME_DEADLINE'])
+
+        def backend_call(display_name, url):
+            return ApiCall(display_name=display_name,
+                           api_request=ApiRequest(url=url,
+                                                  headers=hed,
+                                                  timeout=app.config['BACKEND_TIMEOUT'],
+                                                  deadline=deadline,
+                                                  hedge_percentile=app.config['HEDGE_PERCENTILE']),
+                           logger=app.logger)
+
+        api_calls = [backend_call(BALANCE_NAME, f'{app.config["BALANCES_URI"]}/{account_id}'),
+                     backend_call(TRANSACTION_LIST_NAME,
+                                  f'{app.config["HISTORY_URI"]}/{account_id}')]
+
+        # contacts only change through _add_contact, so serve them from cache when possible
+        contacts_generation = contacts_cache.generation
+        contacts = contacts_cache.get(username)
+        if contacts is None:
+            api_calls.append(backend_call(CONTACTS_NAME,
+                                          f'{app.config["CONTACTS_URI"]}/{username}'))
+
+        # with an earlier balance or history on hand, a call still running at
+        # SOFT_DEADLINE isn't waited for and refreshes it in the background
+        fallback_names = (BALANCE_NAME, TRANSACTION_LIST_NAME)
+        fallbacks = last_known_good.lookup(account_id, fallback_names)
+
+        api_response = aggregate(api_calls, {BALANCE_NAME: None,
+                                             TRANSACTION_LIST_NAME: None,
+                                             CONTACTS_NAME: contacts},
+                                 soft_timeout=app.config['SOFT_DEADLINE'] if fallbacks else None,
+                                 on_late=last_known_good.refreshers(account_id, fallbacks))
+        api_response['stale'] = last_known_good.apply(account_id, fallbacks,
+                                                      api_response, fallback_names)
+        for api_call in api_calls:
+            if api_call.duration is not None:
+                g.timing.add(api_call.display_name, api_call.duration)
+        if contacts is None and api_response[CONTACTS_NAME] is not None:
+            contacts_cache.set(username, api_response[CONTACTS_NAME], contacts_generation)
+        if api_response[CONTACTS_NAME] is None:
+            api_response[CONTACTS_NAME] = []
+
+        # show transactions submitted from this pod that the backends haven't picked up yet
+        api_response[BALANCE_NAME], api_response[TRANSACTION_LIST_NAME] = \
+            pending_transactions.merge(account_id,
+                                       api_response[BALANCE_NAME],
+                                       api_response[TRANSACTION_LIST_NAME])
+        return api_response
+
+    def _render_page(template_name, **context):
+        """
+        Renders a page, or streams it in chunks as it renders if STREAM_TEMPLATES is set
+        """
+        if not app.config['STREAM_TEMPLATES']:
+            return render_template(template_name, **context)
+
+        def buffered(chunks, size=app.config['STREAM_CHUNK_SIZE']):
+            # jinja yields many tiny strings; flush them in larger writes
+            buffer = []
+            buffered_len = 0
+            for chunk in chunks:
+                buffer.append(chunk)
+                buffered_len += len(chunk)
+                if buffered_len >= size:
+                    yield ''.join(buffer)
+                    buffer = []
+                    buffered_len = 0
+            if buffer:
+                yield ''.join(buffer)
+
+        return Response(buffered(stream_template(template_name, **context)),
+                        mimetype='text/html')
 
     def _populate_contact_labels(account_id, transactions, contacts):
         """
@@ -200,6 +310,23 @@ def create_app():
             elif trans['fromAccountNum'] == account_id:
                 trans['accountLabel'] = contact_map.get(trans['toAccountNum'])
 
+    def _populate_display_dates(transactions):
+        """
+        Populate display dates for the passed transactions.
+
+        Side effect:
+            Set the 'displayMonth' and 'displayDay' fields of each transaction
+            from its timestamp, so the template doesn't parse timestamps.
+            If transactions is None, nothing happens.
+
+        Params: transactions - a list of transactions as key/value dicts
+                            [{transaction1}, {transaction2}, ...]
+        """
+        if transactions is None:
+            return
+        for trans in transactions:
+            trans['displayMonth'], trans['displayDay'] = _display_date(trans['timestamp'])
+
     @app.route('/payment', methods=['POST'])
     def payment():
         """
@@ -211,12 +338,13 @@ def create_app():
         - response code from ledgerwriter is not 201
         """
         token = request.cookies.get(app.config['TOKEN_NAME'])
-        if not verify_token(token):
+        token_data = verify_token(token)
+        if not token_data:
             # user isn't authenticated
             app.logger.error('Error submitting payment: user is not authenticated.')
             return abort(401)
         try:
-            account_id = decode_token(token)['acct']
+            account_id = token_data['acct']
             recipient = request.form['account_num']
             if recipient == 'add':
                 recipient = request.form['contact_account_num']
@@ -229,7 +357,7 @@ def create_app():
                                  False)
 
             user_input = request.form['amount']
-            payment_amount = int(Decimal(user_input) * 100)
+            payment_amount = to_cents(user_input)
             transaction_data = {"fromAccountNum": account_id,
                                 "fromRoutingNum": app.config['LOCAL_ROUTING'],
                                 "toAccountNum": recipient,
@@ -262,6 +390,63 @@ def create_app():
                                 _external=True,
                                 _scheme=app.config['SCHEME']))
 
+    @app.route('/payments/batch', methods=['POST'])
+    def payments_batch():
+        """
+        Submits a batch of payments from the authenticated user's account
+        to ledgerwriter, a few at a time.
+
+        The body is a JSON list of objects, or CSV with a header row, with
+        an account_num and amount (in dollars) per payment and an optional
+        uuid. The optional batch_id query parameter makes the uuids
+        generated for payments without one stable across retries.
+
+        Fails with 400 without submitting anything if any payment is
+        invalid. Otherwise returns a report of every payment's outcome.
+        """
+        token = _request_token()
+        token_data = verify_token(token)
+        if not token_data:
+            app.logger.error('Error submitting payment batch: user is not authenticated.')
+            return abort(401)
+        try:
+            rows = parse_payments(request.get_data(as_text=True), request.mimetype)
+        except ValueError as err:
+            return jsonify({'msg': 'invalid payment batch: {}'.format(str(err))}), 400
+        if len(rows) > app.config['PAYMENT_BATCH_MAX_SIZE']:
+            return jsonify({'msg': 'a batch may hold at most {} payments'.format(
+                app.config['PAYMENT_BATCH_MAX_SIZE'])}), 400
+        batch_id = request.args.get('batch_id')
+        # scope batch ids to the account so users can't collide on uuids
+        payments, errors = validate_payments(
+            rows, batch_id and '{}/{}'.format(token_data['acct'], batch_id))
+        if errors:
+            return jsonify({'msg': 'invalid payments, none were submitted',
+                            'errors': errors}), 400
+
+        def submit(payment):
+            try:
+                _post_transaction(token, {"fromAccountNum": token_data['acct'],
+                                          "fromRoutingNum": app.config['LOCAL_ROUTING'],
+                                          "toAccountNum": payment['account_num'],
+                                          "toRoutingNum": app.config['LOCAL_ROUTING'],
+                                          "amount": payment['amount'],
+                                          "uuid": payment['uuid']})
+                return dict(payment, status='submitted')
+            except (requests.exceptions.RequestException, UserWarning) as err:
+                app.logger.error('Error submitting payment %s: %s', payment['uuid'], str(err))
+                return dict(payment, status='failed', error=str(err))
+
+        # the executor bounds how many payments are sent to ledgerwriter at once
+        with g.timing.stage('ledgerwriter'):
+            results = list(get_executor('payments', default_workers=8).map(submit, payments))
+        failed = sum(1 for result in results if result['status'] == 'failed')
+        app.logger.info('Payment batch submitted: %d of %d payments failed.',
+                        failed, len(results))
+        return jsonify({'submitted': len(results) - failed,
+                        'failed': failed,
+                        'results': results}), 200
+
     @app.route('/deposit', methods=['POST'])
     def deposit():
         """
@@ -273,13 +458,14 @@ def create_app():
         - response code from ledgerwriter is not 201
         """
         token = request.cookies.get(app.config['TOKEN_NAME'])
-        if not verify_token(token):
+        token_data = verify_token(token)
+        if not token_data:
             # user isn't authenticated
             app.logger.error('Error submitting deposit: user is not authenticated.')
             return abort(401)
         try:
             # get account id from token
-            account_id = decode_token(token)['acct']
+            account_id = token_data['acct']
             if request.form['account'] == 'add':
                 external_account_num = request.form['external_account_num']
                 external_routing_num = request.form['external_routing_num']
@@ -327,21 +513,31 @@ def create_app():
                                 _scheme=app.config['SCHEME']))
 
     def _submit_transaction(transaction_data):
-        app.logger.debug('Submitting transaction.')
         token = request.cookies.get(app.config['TOKEN_NAME'])
+        with g.timing.stage('ledgerwriter'):
+            _post_transaction(token, transaction_data)
+
+    def _post_transaction(token, transaction_data):
+        """
+        Submits a transaction to ledgerwriter. Doesn't use the request
+        context, so it can run on an executor thread.
+
+        Raise: UserWarning  if the response status is 4xx or 5xx.
+        """
+        app.logger.debug('Submitting transaction.')
         hed = {'Authorization': 'Bearer ' + token,
                'content-type': 'application/json'}
-        resp = requests.post(url=app.config["TRANSACTIONS_URI"],
-                             data=jsonify(transaction_data).data,
-                             headers=hed,
-                             timeout=app.config['BACKEND_TIMEOUT'])
+        resp = get_client().post(url=app.config["TRANSACTIONS_URI"],
+                                 data=json.dumps(transaction_data),
+                                 headers=hed,
+                                 timeout=app.config['BACKEND_TIMEOUT'])
         try:
             resp.raise_for_status()  # Raise on HTTP Status code 4XX or 5XX
         except requests.exceptions.HTTPError as http_request_err:
             raise UserWarning(resp.text) from http_request_err
-        # Short delay to allow the transaction to propagate to balancereader
-        # and transaction-history
-        sleep(0.25)
+        # balancereader and transaction-history pick the transaction up
+        # asynchronously; overlay it on /home until they do
+        pending_transactions.add(transaction_data)
 
     def _add_contact(label, acct_num, routing_num, is_external_acct=False):
         """
@@ -359,12 +555,14 @@ def create_app():
             'routing_num': routing_num,
             'is_external': is_external_acct
         }
-        token_data = decode_token(token)
+        token_data = verify_token(token)
         url = '{}/{}'.format(app.config["CONTACTS_URI"], token_data['user'])
-        resp = requests.post(url=url,
-                             data=jsonify(contact_data).data,
-                             headers=hed,
-                             timeout=app.config['BACKEND_TIMEOUT'])
+        with g.timing.stage('contacts'):
+            resp = get_client().post(url=url,
+                                     data=jsonify(contact_data).data,
+                                     headers=hed,
+                                     timeout=app.config['BACKEND_TIMEOUT'])
+        contacts_cache.invalidate(token_data['user'])
         try:
             resp.raise_for_status()  # Raise on HTTP Status code 4XX or 5XX
         except requests.exceptions.HTTPError as http_request_err:
@@ -415,7 +613,7 @@ def create_app():
         return render_template('login.html',
                                app_name=app_name,
                                bank_name=os.getenv('BANK_NAME', 'Bank of Anthos'),
-                               cluster_name=cluster_name,
+                               cluster_name=instance_metadata.cluster_name,
                                cymbal_logo=os.getenv('CYMBAL_LOGO', 'false'),
                                default_password=os.getenv('DEFAULT_PASSWORD', ''),
                                default_user=os.getenv('DEFAULT_USERNAME', ''),
@@ -423,7 +621,7 @@ def create_app():
                                platform=platform,
                                platform_display_name=platform_display_name,
                                pod_name=pod_name,
-                               pod_zone=pod_zone,
+                               pod_zone=instance_metadata.pod_zone,
                                redirect_uri=redirect_uri,
                                response_type=response_type,
                                state=state)
@@ -442,9 +640,9 @@ def create_app():
     def _login_helper(username, password, request_args):
         try:
             app.logger.debug('Logging in.')
-            req = requests.get(url=app.config["LOGIN_URI"],
-                               params={'username': username, 'password': password},
-                               timeout=app.config['BACKEND_TIMEOUT']*2)
+            req = get_client().get(url=app.config["LOGIN_URI"],
+                                   params={'username': username, 'password': password},
+                                   timeout=app.config['BACKEND_TIMEOUT']*2)
             req.raise_for_status()  # Raise on HTTP Status code 4XX or 5XX
 
             # login success
@@ -497,12 +695,12 @@ def create_app():
             return render_template('consent.html',
                                    app_name=app_name,
                                    bank_name=os.getenv('BANK_NAME', 'Bank of Anthos'),
-                                   cluster_name=cluster_name,
+                                   cluster_name=instance_metadata.cluster_name,
                                    cymbal_logo=os.getenv('CYMBAL_LOGO', 'false'),
                                    platform=platform,
                                    platform_display_name=platform_display_name,
                                    pod_name=pod_name,
-                                   pod_zone=pod_zone,
+                                   pod_zone=instance_metadata.pod_zone,
                                    redirect_uri=redirect_uri,
                                    state=state)
 
@@ -538,6 +736,7 @@ def create_app():
     def _auth_callback_helper(state, redirect_uri, token):
         try:
             app.logger.debug('Retrieving authorization code.')
+            # redirect_uri is the client's callback, not a backend: no pooled session
             callback_response = requests.post(url=redirect_uri,
                                               data={'state': state, 'id_token': token},
                                               timeout=app.config['BACKEND_TIMEOUT'],
@@ -567,12 +766,12 @@ def create_app():
                                     _scheme=app.config['SCHEME']))
         return render_template('signup.html',
                                bank_name=os.getenv('BANK_NAME', 'Bank of Anthos'),
-                               cluster_name=cluster_name,
+                               cluster_name=instance_metadata.cluster_name,
                                cymbal_logo=os.getenv('CYMBAL_LOGO', 'false'),
                                platform=platform,
                                platform_display_name=platform_display_name,
                                pod_name=pod_name,
-                               pod_zone=pod_zone)
+                               pod_zone=instance_metadata.pod_zone)
 
     @app.route("/signup", methods=['POST'])
     def signup():
@@ -584,9 +783,9 @@ def create_app():
         try:
             # create user
             app.logger.debug('Creating new user.')
-            resp = requests.post(url=app.config["USERSERVICE_URI"],
-                                 data=request.form,
-                                 timeout=app.config['BACKEND_TIMEOUT'])
+            resp = get_client().post(url=app.config["USERSERVICE_URI"],
+                                     data=request.form,
+                                     timeout=app.config['BACKEND_TIMEOUT'])
             if resp.status_code == 201:
                 # user created. Attempt login
                 app.logger.info('New user created.')
@@ -621,33 +820,36 @@ def create_app():
     def verify_token(token):
         """
         Validates token using userservice public key
+
+        Return: the verified token claims, or None if the token is not valid
         """
         app.logger.debug('Verifying token.')
         if token is None:
-            return False
+            return None
         try:
-            jwt.decode(algorithms='RS256',
-                       jwt=token,
-                       key=app.config['PUBLIC_KEY'],
-                       options={"verify_signature": True})
+            with g.timing.stage('token'):
+                claims = claims_cache.verify(token)
             app.logger.debug('Token verified.')
-            return True
+            return claims
         except jwt.exceptions.InvalidTokenError as err:
             app.logger.error('Error validating token: %s', str(err))
-            return False
+            return None
+
+    @functools.lru_cache(maxsize=4096)
+    def _display_date(timestamp):
+        """ Parse the input timestamp once into its (month, day) display strings """
+        # TODO: time zones?
+        date = datetime.datetime.strptime(timestamp, app.config['TIMESTAMP_FORMAT'])
+        return date.strftime('%b'), date.strftime('%d')
 
     # register html template formatters
     def format_timestamp_day(timestamp):
         """ Format the input timestamp day in a human readable way """
-        # TODO: time zones?
-        date = datetime.datetime.strptime(timestamp, app.config['TIMESTAMP_FORMAT'])
-        return date.strftime('%d')
+        return _display_date(timestamp)[1]
 
     def format_timestamp_month(timestamp):
         """ Format the input timestamp month in a human readable way """
-        # TODO: time zones?
-        date = datetime.datetime.strptime(timestamp, app.config['TIMESTAMP_FORMAT'])
-        return date.strftime('%b')
+        return _display_date(timestamp)[0]
 
     def format_currency(int_amount):
         """ Format the input currency in a human readable way """
@@ -675,47 +877,73 @@ def create_app():
     app.config['LOCAL_ROUTING'] = os.getenv('LOCAL_ROUTING_NUM')
     # timeout in seconds for calls to the backend
     app.config['BACKEND_TIMEOUT'] = int(os.getenv('BACKEND_TIMEOUT', '4'))
+    # total time budget in seconds for the backend calls made by /home
+    app.config['HOME_DEADLINE'] = float(os.getenv('HOME_DEADLINE', app.config['BACKEND_TIMEOUT']))
+    # latency percentile after which idempotent reads are hedged; unset to disable
+    app.config['HEDGE_PERCENTILE'] = (float(os.environ['HEDGE_PERCENTILE'])
+                                      if os.getenv('HEDGE_PERCENTILE') else None)
     app.config['TOKEN_NAME'] = 'token'
     app.config['CONSENT_COOKIE'] = 'consented'
     app.config['TIMESTAMP_FORMAT'] = '%Y-%m-%dT%H:%M:%S.%f%z'
     app.config['SCHEME'] = os.environ.get('SCHEME', 'http')
-
-    # where am I?
-    metadata_server = os.getenv('METADATA_SERVER', 'metadata.google.internal')
-    metadata_url = f'http://{metadata_server}/computeMetadata/v1/'
-    metadata_headers = {'Metadata-Flavor': 'Google'}
-
-    # get GKE cluster name
-    cluster_name = os.getenv('CLUSTER_NAME', 'unknown')
-    try:
-        req = requests.get(metadata_url + 'instance/attributes/cluster-name',
-                           headers=metadata_headers,
-                           timeout=app.config['BACKEND_TIMEOUT'])
-        if req.ok:
-            cluster_name = str(req.text)
-    except (RequestException, HTTPError) as err:
-        app.logger.warning(
-            "Unable to retrieve cluster name from metadata server %s.", metadata_server)
+    app.config['HISTORY_PAGE_SIZE'] = int(os.getenv('HISTORY_PAGE_SIZE', '50'))
+    app.config['HISTORY_MAX_PAGE_SIZE'] = 500
+    app.config['STREAM_TEMPLATES'] = os.getenv('STREAM_TEMPLATES', 'false') == 'true'
+    app.config['STREAM_CHUNK_SIZE'] = int(os.getenv('STREAM_CHUNK_SIZE', '8192'))
+    # seconds after which /home shows the last known balance and history
+    app.config['SOFT_DEADLINE'] = float(os.getenv('SOFT_DEADLINE', '1'))
+    app.config['PAYMENT_BATCH_MAX_SIZE'] = int(os.getenv('PAYMENT_BATCH_MAX_SIZE', '1000'))
+
+    claims_cache = VerifiedClaimsCache(app.config['PUBLIC_KEY'],
+                                       max_size=int(os.getenv('TOKEN_CACHE_SIZE', '1024')))
+    # contacts cache, invalidated on writes from this pod and bounded by TTL otherwise
+    contacts_cache = TTLCache(max_size=int(os.getenv('CONTACTS_CACHE_SIZE', '1024')),
+                              ttl=float(os.getenv('CONTACTS_CACHE_TTL', '30')))
+    # last successfully fetched balance and history per account
+    last_known_good = LastKnownGood(max_size=int(os.getenv('STALE_CACHE_SIZE', '1024')),
+                                    max_age=float(os.getenv('STALE_MAX_AGE', '300')))
+    pending_transactions = PendingTransactions(
+        app.config['LOCAL_ROUTING'],
+        app.config['TIMESTAMP_FORMAT'],
+        ttl=float(os.getenv('PENDING_TRANSACTION_TTL', '30')))
+
+    @collector('frontend_cache_entries', 'gauge', 'Entries held by in-process caches')
+    def _cache_sizes():
+        return [({'cache': 'token'}, claims_cache.stats()['size']),
+                ({'cache': 'contacts'}, contacts_cache.stats()['size']),
+                ({'cache': 'last_known_good'}, last_known_good.stats()['size'])]
+
+    @collector('frontend_cache_lookups_total', 'counter', 'In-process cache lookups by result')
+    def _cache_lookups():
+        return [({'cache': name, 'result': result}, cache.stats()[result])
+                for name, cache in (('token', claims_cache), ('contacts', contacts_cache))
+                for result in ('hits', 'misses')]
+
+    # where am I? looked up in the background so workers start right away
+    instance_metadata = InstanceMetadata(
+        os.getenv('METADATA_SERVER', 'metadata.google.internal'),
+        timeout=app.config['BACKEND_TIMEOUT'],
+        cache_path=os.getenv('METADATA_CACHE_PATH', '/tmp/frontend-metadata.json'),
+        logger=app.logger,
+        overrides={'cluster_name': os.getenv('CLUSTER_NAME'),
+                   'pod_zone': os.getenv('POD_ZONE')})
 
     # get GKE pod name
     pod_name = "unknown"
     pod_name = socket.gethostname()
 
-    # get GKE node zone
-    pod_zone = os.getenv('POD_ZONE', 'unknown')
-    try:
-        req = requests.get(metadata_url + 'instance/zone',
-                           headers=metadata_headers,
-                           timeout=app.config['BACKEND_TIMEOUT'])
-        if req.ok:
-            pod_zone = str(req.text.split("/")[3])
-    except (RequestException, HTTPError) as err:
-        app.logger.warning("Unable to retrieve zone from metadata server %s.", metadata_server)
-
     # register formater functions
     app.jinja_env.globals.update(format_currency=format_currency)
+    app.jinja_env.globals.update(format_age=format_age)
     app.jinja_env.globals.update(format_timestamp_month=format_timestamp_month)
     app.jinja_env.globals.update(format_timestamp_day=format_timestamp_day)
+    # gzip responses for clients that accept it
+    Compressor(min_size=int(os.getenv('COMPRESSION_MIN_SIZE', '1024')),
+               level=int(os.getenv('COMPRESSION_LEVEL', '6'))).register(app)
+    # serve static files at content-hashed URLs that clients cache forever
+    StaticAssets(app.static_folder).register(app)
+    # render shared partials (head, footer, ...) once per set of inputs
+    FragmentCache(app.jinja_env).register()
 
     # Set up logging
     app.logger.handlers = logging.getLogger('gunicorn.error').handlers
@@ -731,9 +959,10 @@ def create_app():
             BatchSpanProcessor(cloud_trace_exporter)
         )
         set_global_textmap(CloudTraceFormatPropagator())
-        # Add tracing auto-instrumentation for Flask, jinja and requests
+        # Add tracing auto-instrumentation for Flask, jinja, requests and httpx
         FlaskInstrumentor().instrument_app(app)
         RequestsInstrumentor().instrument()
+        HTTPXClientInstrumentor().instrument()
         Jinja2Instrumentor().instrument()
     else:
         app.logger.info("🚫 Tracing disabled.")
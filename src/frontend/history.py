@@ -0,0 +1,40 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Paging through transaction history"""
+
+
+def paginate_history(transactions, cursor, page_size):
+    """
+    Select one page of transaction history.
+
+    Params: transactions - a list of transactions, newest first, or None
+            cursor - only return transactions with a transactionId below
+                     this value; None for the first page
+            page_size - the maximum number of transactions to return
+    Return: (page, next_cursor) where next_cursor is None on the last page.
+            Transactions still pending in ledger readers have no
+            transactionId and only appear on the first page. The page
+            holds copies, so display fields can be added to them without
+            changing the cached history they came from.
+    """
+    if transactions is None:
+        return None, None
+    if cursor is not None:
+        transactions = [t for t in transactions
+                        if t.get('transactionId') is not None
+                        and t['transactionId'] < cursor]
+    rest = [t['transactionId'] for t in transactions[page_size:]
+            if t.get('transactionId') is not None]
+    return [dict(t) for t in transactions[:page_size]], (rest[0] + 1 if rest else None)
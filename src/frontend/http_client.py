@@ -0,0 +1,294 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pooled keep-alive HTTP sessions for calls to backend services"""
+
+import asyncio
+import os
+import threading
+import time
+import weakref
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import collector, counter, histogram
+
+BACKEND_LATENCY = histogram('frontend_backend_request_duration_seconds',
+                            'Latency of requests to backend services',
+                            labels=('backend', 'method'))
+BACKEND_ERRORS = counter('frontend_backend_errors_total',
+                         'Backend requests that failed or returned a 5xx status',
+                         labels=('backend', 'method'))
+
+
+class BackendPool:
+    """Keep-alive session with a bounded connection pool for one backend host"""
+
+    def __init__(self, pool_size):
+        """Initialize a backend pool"""
+        self.pool_size = pool_size
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        # the session is shared by every user of the worker, so a cookie set
+        # by a backend must not be sent along with someone else's request
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self.last_used = time.monotonic()
+        self.requests = 0
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        """Send a request over this pool's session"""
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.last_used = time.monotonic()
+        host = urlsplit(url).netloc
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+            if response.status_code >= 500:
+                BACKEND_ERRORS.inc(backend=host, method=method)
+            return response
+        except requests.exceptions.RequestException:
+            BACKEND_ERRORS.inc(backend=host, method=method)
+            raise
+        finally:
+            BACKEND_LATENCY.observe(time.perf_counter() - start,
+                                    backend=host, method=method)
+            with self.lock:
+                self.in_flight -= 1
+                self.last_used = time.monotonic()
+
+    def is_idle(self, idle_timeout):
+        """Whether nothing has been sent through this pool for idle_timeout seconds"""
+        with self.lock:
+            return (self.in_flight == 0
+                    and time.monotonic() - self.last_used > idle_timeout)
+
+    def stats(self):
+        """Return pool usage counters for this backend"""
+        opened = 0
+        idle = 0
+        # urllib3 keeps one connection pool per scheme/host/port
+        for key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            # the pool queue is pre-filled with None placeholders
+            if pool.pool is not None:
+                idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        with self.lock:
+            return {'pool_size': self.pool_size,
+                    'requests': self.requests,
+                    'in_flight': self.in_flight,
+                    'connections_opened': opened,
+                    'connections_idle': idle}
+
+    def close(self):
+        """Close every pooled connection"""
+        self.session.close()
+
+
+class BackendClient:
+    """Process-wide registry of per-backend connection pools.
+
+    Each backend host gets its own keep-alive session so connections to
+    balancereader, transactionhistory, contacts, etc. are reused across
+    requests. Pools that have been idle for longer than idle_timeout seconds
+    are closed and recreated on next use.
+    """
+
+    def __init__(self, pool_size=10, pool_sizes=None, idle_timeout=60):
+        """Initialize a backend client"""
+        self.pool_size = pool_size
+        self.pool_sizes = pool_sizes or {}
+        self.idle_timeout = idle_timeout
+        self.pools = {}
+        self.evicted = 0
+        self.lock = threading.Lock()
+        self.last_eviction = time.monotonic()
+
+    @classmethod
+    def from_env(cls):
+        """Create a client configured from environment variables, see _pool_settings"""
+        return cls(**_pool_settings())
+
+    def pool_for(self, url):
+        """Return the pool for the host in url, creating it if needed"""
+        host = urlsplit(url).netloc
+        self._evict_idle()
+        with self.lock:
+            pool = self.pools.get(host)
+            if pool is None:
+                pool = BackendPool(self.pool_sizes.get(host, self.pool_size))
+                self.pools[host] = pool
+            return pool
+
+    def _evict_idle(self):
+        """Close pools that have not been used within idle_timeout"""
+        now = time.monotonic()
+        if now - self.last_eviction < self.idle_timeout / 2:
+            return
+        with self.lock:
+            self.last_eviction = now
+            for host, pool in list(self.pools.items()):
+                if pool.is_idle(self.idle_timeout):
+                    del self.pools[host]
+                    pool.close()
+                    self.evicted += 1
+
+    def request(self, method, url, **kwargs):
+        """Send a request to a backend over its pooled session"""
+        return self.pool_for(url).request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        """Send a GET request to a backend"""
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """Send a POST request to a backend"""
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """Return pool usage counters keyed by backend host"""
+        with self.lock:
+            pools = dict(self.pools)
+        return {host: pool.stats() for host, pool in pools.items()}
+
+
+class AsyncBackendClient:
+    """Per-backend connection pools for calls made on an event loop.
+
+    The asyncio counterpart of BackendClient: each backend host gets its own
+    httpx.AsyncClient holding at most pool_sizes.get(host, pool_size)
+    connections, and connections unused for idle_timeout seconds are closed.
+    """
+
+    def __init__(self, pool_size=10, pool_sizes=None, idle_timeout=60):
+        """Initialize an async backend client"""
+        self.pool_size = pool_size
+        self.pool_sizes = pool_sizes or {}
+        self.idle_timeout = idle_timeout
+        self.clients = {}
+
+    @classmethod
+    def from_env(cls):
+        """Create a client configured from environment variables, see _pool_settings"""
+        return cls(**_pool_settings())
+
+    def client_for(self, host):
+        """Return the httpx client for host, creating it if needed"""
+        client = self.clients.get(host)
+        if client is None:
+            size = self.pool_sizes.get(host, self.pool_size)
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=size,
+                                    max_keepalive_connections=size,
+                                    keepalive_expiry=self.idle_timeout),
+                # shared by every user of the worker, like BackendPool's session
+                cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])))
+            self.clients[host] = client
+        return client
+
+    async def request(self, method, url, **kwargs):
+        """Send a request to a backend over its pooled connections"""
+        host = urlsplit(url).netloc
+        start = time.perf_counter()
+        try:
+            response = await self.client_for(host).request(method, url, **kwargs)
+            if response.status_code >= 500:
+                BACKEND_ERRORS.inc(backend=host, method=method)
+            return response
+        except httpx.HTTPError:
+            BACKEND_ERRORS.inc(backend=host, method=method)
+            raise
+        finally:
+            BACKEND_LATENCY.observe(time.perf_counter() - start,
+                                    backend=host, method=method)
+
+    async def get(self, url, **kwargs):
+        """Send a GET request to a backend"""
+        return await self.request('GET', url, **kwargs)
+
+
+def _pool_settings():
+    """Return backend pool settings from environment variables
+
+    BACKEND_POOL_SIZE          default max connections kept per backend
+    BACKEND_POOL_SIZES         per-host overrides, e.g. "contacts:8080=4,balancereader:8080=20"
+    BACKEND_POOL_IDLE_TIMEOUT  seconds before an unused pool is closed
+    """
+    pool_sizes = {}
+    for entry in os.getenv('BACKEND_POOL_SIZES', '').split(','):
+        if '=' in entry:
+            host, size = entry.rsplit('=', 1)
+            pool_sizes[host.strip()] = int(size)
+    return {'pool_size': int(os.getenv('BACKEND_POOL_SIZE', '10')),
+            'pool_sizes': pool_sizes,
+            'idle_timeout': float(os.getenv('BACKEND_POOL_IDLE_TIMEOUT', '60'))}
+
+
+_CLIENT = None
+_CLIENT_PID = None
+_CLIENT_LOCK = threading.Lock()
+# AsyncBackendClient per event loop
+_ASYNC_CLIENTS = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    """Return the process-wide BackendClient.
+
+    The client is created lazily so that every gunicorn worker gets its own
+    pools instead of sharing sockets inherited from the parent process.
+    """
+    global _CLIENT, _CLIENT_PID  # pylint: disable=global-statement
+    with _CLIENT_LOCK:
+        if _CLIENT is None or _CLIENT_PID != os.getpid():
+            _CLIENT = BackendClient.from_env()
+            _CLIENT_PID = os.getpid()
+        return _CLIENT
+
+
+def get_async_client():
+    """Return the AsyncBackendClient of the running event loop.
+
+    httpx connections can't be shared between event loops, so the fan-out
+    loop of each worker process, or the loop of an ASGI server, gets its own.
+    """
+    loop = asyncio.get_running_loop()
+    with _CLIENT_LOCK:
+        client = _ASYNC_CLIENTS.get(loop)
+        if client is None:
+            client = _ASYNC_CLIENTS[loop] = AsyncBackendClient.from_env()
+        return client
+
+
+@collector('frontend_backend_pool_connections', 'gauge',
+           'Connections opened to each backend, by state')
+def _pool_connections():
+    """Export connection pool usage per backend"""
+    samples = []
+    for host, stats in get_client().stats().items():
+        samples.append(({'backend': host, 'state': 'opened'}, stats['connections_opened']))
+        samples.append(({'backend': host, 'state': 'idle'}, stats['connections_idle']))
+        samples.append(({'backend': host, 'state': 'in_flight'}, stats['in_flight']))
+    return samples
@@ -0,0 +1,74 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fallback to the last successfully fetched backend data"""
+
+import functools
+import time
+
+from cache import TTLCache
+
+
+class LastKnownGood:
+    """Last successfully fetched value of backend calls, per account.
+
+    When a call fails, or is still running at the soft deadline, the
+    value it returned last time is shown instead, marked with when it was
+    fetched. Values older than max_age seconds are not used, and at most
+    max_size account/call pairs are kept.
+    """
+
+    def __init__(self, max_size, max_age):
+        """Initialize an empty cache"""
+        self.cache = TTLCache(max_size=max_size, ttl=max_age)
+
+    def remember(self, account_id, name, value):
+        """Keep value as the fallback for call name of account_id"""
+        self.cache.set((name, account_id), (value, int(time.time())))
+
+    def lookup(self, account_id, names):
+        """Return {name: (value, epoch time fetched)} for the calls with a fallback"""
+        fallbacks = {name: self.cache.get((name, account_id)) for name in names}
+        return {name: fallback for name, fallback in fallbacks.items() if fallback is not None}
+
+    def refreshers(self, account_id, fallbacks):
+        """Return {name: callback} that remembers late results of the calls in fallbacks"""
+        return {name: functools.partial(self.remember, account_id, name) for name in fallbacks}
+
+    def apply(self, account_id, fallbacks, api_response, names):
+        """Remember fresh values in api_response and fill in fallbacks for missing ones.
+
+        Return: {name: epoch time fetched} for every value that is stale
+        """
+        stale = {}
+        for name in names:
+            if api_response[name] is not None:
+                self.remember(account_id, name, api_response[name])
+            elif name in fallbacks:
+                api_response[name], stale[name] = fallbacks[name]
+        return stale
+
+    def stats(self):
+        """Return cache size and hit/miss counters"""
+        return self.cache.stats()
+
+
+def format_age(epoch_seconds):
+    """ Format how long ago an epoch time was in a human readable way """
+    seconds = max(0, int(time.time()) - epoch_seconds)
+    if seconds < 60:
+        return '{} seconds ago'.format(seconds)
+    if seconds < 3600:
+        return '{} minutes ago'.format(seconds // 60)
+    return '{} hours ago'.format(seconds // 3600)
@@ -0,0 +1,127 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Non-blocking lookups of where this pod is running"""
+
+import json
+import os
+import threading
+
+from requests.exceptions import RequestException
+
+from http_client import get_client
+
+UNKNOWN = 'unknown'
+
+# value name -> (metadata server path, parser for the response body)
+FIELDS = {
+    'cluster_name': ('instance/attributes/cluster-name', str),
+    # projects/<number>/zones/<zone>
+    'pod_zone': ('instance/zone', lambda text: text.split('/')[3]),
+}
+
+
+class InstanceMetadata:
+    """Cluster name and zone of this pod.
+
+    Values given as overrides (the CLUSTER_NAME and POD_ZONE environment
+    variables) are used as-is and never looked up. The others are fetched
+    from the metadata server on a background thread, so workers start
+    without waiting on it, and are read as 'unknown' until the lookup
+    succeeds. Looked up values are saved to cache_path, which gunicorn
+    workers forked later and restarted workers read instead of asking the
+    metadata server again.
+    """
+
+    def __init__(self, server, timeout, cache_path, logger, overrides=None):
+        """Initialize from overrides and the disk cache, and start the lookup"""
+        self.url = f'http://{server}/computeMetadata/v1/'
+        self.timeout = timeout
+        self.cache_path = cache_path
+        self.logger = logger
+        self.values = {name: value for name, value in (overrides or {}).items() if value}
+        self.lookup_pid = None
+        self.lock = threading.Lock()
+        for name, value in self._read_cache().items():
+            self.values.setdefault(name, value)
+        self._start_lookup()
+
+    @property
+    def cluster_name(self):
+        """Name of the GKE cluster"""
+        return self.get('cluster_name')
+
+    @property
+    def pod_zone(self):
+        """Zone of the node this pod runs on"""
+        return self.get('pod_zone')
+
+    def get(self, name):
+        """Return the value of name, or 'unknown' if it is not resolved yet"""
+        value = self.values.get(name)
+        if value is None:
+            # a lookup started before a fork did not survive it
+            self._start_lookup()
+            return UNKNOWN
+        return value
+
+    def _missing(self):
+        """Names of the values that are neither overridden nor looked up yet"""
+        return [name for name in FIELDS if name not in self.values]
+
+    def _start_lookup(self):
+        """Look up missing values on a background thread, once per process"""
+        with self.lock:
+            if not self._missing() or self.lookup_pid == os.getpid():
+                return
+            self.lookup_pid = os.getpid()
+        threading.Thread(target=self._lookup, name='metadata', daemon=True).start()
+
+    def _lookup(self):
+        """Ask the metadata server for every missing value"""
+        found = {}
+        for name in self._missing():
+            path, parse = FIELDS[name]
+            try:
+                response = get_client().get(self.url + path,
+                                            headers={'Metadata-Flavor': 'Google'},
+                                            timeout=self.timeout)
+                if response.ok:
+                    found[name] = self.values[name] = parse(response.text)
+            except (RequestException, IndexError):
+                self.logger.warning('Unable to retrieve %s from metadata server %s.',
+                                    name, self.url)
+        if found:
+            self._write_cache(dict(self._read_cache(), **found))
+
+    def _read_cache(self):
+        """Return the values saved by an earlier lookup, if any"""
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as cache_file:
+                values = json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+        return {name: values[name] for name in FIELDS if isinstance(values.get(name), str)}
+
+    def _write_cache(self, values):
+        """Save looked up values for other workers; overrides are not saved"""
+        # write then rename, so concurrent readers never see a partial file
+        tmp_path = f'{self.cache_path}.{os.getpid()}'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as cache_file:
+                json.dump(values, cache_file)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as err:
+            self.logger.warning('Unable to cache instance metadata in %s: %s',
+                                self.cache_path, str(err))
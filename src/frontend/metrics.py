@@ -0,0 +1,185 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-process metrics for the frontend, exported in Prometheus text format"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+REGISTRY = []
+COLLECTORS = {}
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    """Monotonically increasing count, kept per combination of label values"""
+
+    def __init__(self, name, description, labels=()):
+        """Initialize a counter"""
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """Add amount to the count for the given label values"""
+        key = tuple(labels.get(label, '') for label in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        """Return a list of (name, label dict, value) samples"""
+        with self.lock:
+            return [(self.name, dict(zip(self.labels, key)), value)
+                    for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    """Value that can go up and down, kept per combination of label values"""
+
+    def dec(self, amount=1, **labels):
+        """Subtract amount from the value for the given label values"""
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """Distribution of observed values, kept per combination of label values"""
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        """Initialize a histogram"""
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """Record one observation for the given label values"""
+        key = tuple(labels.get(label, '') for label in self.labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def samples(self):
+        """Return a list of (name, label dict, value) samples"""
+        samples = []
+        with self.lock:
+            for key, counts in self.values.items():
+                labels = dict(zip(self.labels, key))
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    samples.append((self.name + '_bucket', dict(labels, le=str(bound)), count))
+                samples.append((self.name + '_count', labels, counts[-2]))
+                samples.append((self.name + '_sum', labels, counts[-1]))
+        return samples
+
+
+def _register(metric):
+    """Add metric to the registry exported by render()"""
+    REGISTRY.append(metric)
+    return metric
+
+
+def counter(name, description, labels=()):
+    """Create and register a counter"""
+    return _register(Counter(name, description, labels))
+
+
+def gauge(name, description, labels=()):
+    """Create and register a gauge"""
+    return _register(Gauge(name, description, labels))
+
+
+def histogram(name, description, labels=(), buckets=DEFAULT_BUCKETS):
+    """Create and register a histogram"""
+    return _register(Histogram(name, description, labels, buckets))
+
+
+def collector(name, metric_type, description):
+    """Register a function that returns the current samples of a metric.
+
+    Used to export state that other components already keep, e.g. pool or
+    cache statistics. The function returns a list of (label dict, value).
+    Registering a name again replaces its function.
+    """
+    def decorator(function):
+        COLLECTORS[name] = (metric_type, description, function)
+        return function
+    return decorator
+
+
+def _format_labels(labels):
+    """Format a label dict as {key="value",...}"""
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(
+        key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for key, value in labels.items()) + '}'
+
+
+def render():
+    """Return every registered metric in Prometheus text exposition format"""
+    lines = []
+    metric_types = ((Histogram, 'histogram'), (Gauge, 'gauge'), (Counter, 'counter'))
+    for metric in REGISTRY:
+        metric_type = next(name for cls, name in metric_types if isinstance(metric, cls))
+        lines.append('# HELP {} {}'.format(metric.name, metric.description))
+        lines.append('# TYPE {} {}'.format(metric.name, metric_type))
+        for name, labels, value in metric.samples():
+            lines.append('{}{} {}'.format(name, _format_labels(labels), value))
+    for name, (metric_type, description, function) in list(COLLECTORS.items()):
+        lines.append('# HELP {} {}'.format(name, description))
+        lines.append('# TYPE {} {}'.format(name, metric_type))
+        for labels, value in function():
+            lines.append('{}{} {}'.format(name, _format_labels(labels), value))
+    return '\n'.join(lines) + '\n'
+
+
+class ServerTiming:
+    """Durations of the stages of one request, sent as a Server-Timing header"""
+
+    def __init__(self):
+        """Initialize an empty timing"""
+        self.stages = []
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds):
+        """Record that stage name took seconds"""
+        with self.lock:
+            self.stages.append((name, seconds))
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as stage name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def header(self):
+        """Return the Server-Timing header value"""
+        with self.lock:
+            return ', '.join('{};dur={:.1f}'.format(name, seconds * 1000)
+                             for name, seconds in self.stages)
@@ -0,0 +1,175 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Read-your-writes overlay for transactions submitted by this frontend"""
+
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+# tolerated clock difference between this pod and the ledger database
+CLOCK_SKEW = datetime.timedelta(seconds=5)
+# accounts whose last fetched balance is remembered
+MAX_BALANCES = 1024
+
+
+class PendingTransactions:
+    """Transactions accepted by ledgerwriter that the readers may not have seen yet.
+
+    balancereader and transactionhistory poll the ledger independently, so a
+    transaction shows up in each of them at its own time after ledgerwriter
+    accepts it. Until it shows up in the fetched history, merge() adds it to
+    the rendered history. Entries are dropped once the history contains a
+    matching transaction, or after ttl seconds.
+
+    The balance is judged separately: each transaction remembers the
+    balance last fetched for the account before it was submitted, and is
+    added to the rendered balance only while balancereader still reports
+    exactly that balance. Once the balance moves, it is assumed to include
+    the transaction, so a lagging balance is shown rather than one that
+    counts the transaction twice.
+    """
+
+    def __init__(self, local_routing, timestamp_format, ttl=30, max_per_account=50):
+        """Initialize an empty overlay"""
+        self.local_routing = local_routing
+        self.timestamp_format = timestamp_format
+        self.ttl = ttl
+        self.max_per_account = max_per_account
+        # account id -> OrderedDict of transaction uuid ->
+        #     (expiry, transaction, balance when submitted)
+        self.accounts = {}
+        # account id -> last balance fetched from balancereader, least recent first
+        self.balances = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, transaction_data):
+        """Remember a transaction accepted by ledgerwriter, keyed by its uuid"""
+        transaction = {
+            'fromAccountNum': transaction_data['fromAccountNum'],
+            'fromRoutingNum': transaction_data['fromRoutingNum'],
+            'toAccountNum': transaction_data['toAccountNum'],
+            'toRoutingNum': transaction_data['toRoutingNum'],
+            'amount': transaction_data['amount'],
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).strftime(
+                self.timestamp_format),
+            'pending': True,
+        }
+        expiry = time.monotonic() + self.ttl
+        with self.lock:
+            for account_id, routing in ((transaction['fromAccountNum'],
+                                         transaction['fromRoutingNum']),
+                                        (transaction['toAccountNum'],
+                                         transaction['toRoutingNum'])):
+                if routing != self.local_routing:
+                    continue
+                pending = self.accounts.setdefault(account_id, OrderedDict())
+                pending[transaction_data['uuid']] = (expiry, transaction,
+                                                     self.balances.get(account_id))
+                while len(pending) > self.max_per_account:
+                    pending.popitem(last=False)
+
+    def _live(self, account_id):
+        """Return unexpired pending transactions for account_id, oldest first"""
+        now = time.monotonic()
+        with self.lock:
+            pending = self.accounts.get(account_id)
+            if not pending:
+                return []
+            for uuid in [u for u, (expiry, _, _) in pending.items() if expiry <= now]:
+                del pending[uuid]
+            if not pending:
+                del self.accounts[account_id]
+                return []
+            return [(uuid, transaction, base) for uuid, (_, transaction, base)
+                    in pending.items()]
+
+    def _observe(self, account_id, balance):
+        """Remember the balance balancereader last reported for account_id"""
+        with self.lock:
+            self.balances[account_id] = balance
+            self.balances.move_to_end(account_id)
+            while len(self.balances) > MAX_BALANCES:
+                self.balances.popitem(last=False)
+
+    def _discard(self, account_id, uuids):
+        """Drop pending transactions that the backends have caught up with"""
+        with self.lock:
+            pending = self.accounts.get(account_id)
+            if pending is None:
+                return
+            for uuid in uuids:
+                pending.pop(uuid, None)
+            if not pending:
+                del self.accounts[account_id]
+
+    def merge(self, account_id, balance, history):
+        """Overlay pending transactions onto the fetched balance and history.
+
+        Return: the (balance, history) to render. If history could not be
+                fetched, nothing is merged since there is no way to tell
+                which pending transactions the backends already include.
+        """
+        pending = self._live(account_id)
+        if balance is not None:
+            self._observe(account_id, balance)
+        if not pending or history is None:
+            return balance, history
+
+        oldest = min(datetime.datetime.strptime(t['timestamp'], self.timestamp_format)
+                     for _, t, _ in pending) - CLOCK_SKEW
+        # history is newest first; only rows written after the oldest
+        # pending submission can match
+        recent = []
+        for row in history:
+            if datetime.datetime.strptime(row['timestamp'], self.timestamp_format) < oldest:
+                break
+            recent.append(row)
+
+        reflected = []
+        unreflected = []
+        for uuid, transaction, base in pending:
+            match = next((row for row in recent
+                          if row['fromAccountNum'] == transaction['fromAccountNum']
+                          and row['toAccountNum'] == transaction['toAccountNum']
+                          and row['amount'] == transaction['amount']), None)
+            if match is not None:
+                recent.remove(match)
+                reflected.append(uuid)
+            else:
+                unreflected.append((transaction, base))
+        if reflected:
+            self._discard(account_id, reflected)
+        if not unreflected:
+            return balance, history
+
+        return (self._adjust_balance(account_id, balance, unreflected),
+                [dict(t) for t, _ in reversed(unreflected)] + history)
+
+    @staticmethod
+    def _adjust_balance(account_id, balance, unreflected):
+        """Add the transactions balancereader hasn't applied yet to balance"""
+        if balance is None:
+            return None
+        adjusted = balance
+        for transaction, base in unreflected:
+            # a balance that moved since submission already includes it
+            if balance != base:
+                continue
+            if transaction['toAccountNum'] == account_id:
+                adjusted += transaction['amount']
+            else:
+                adjusted -= transaction['amount']
+        return adjusted
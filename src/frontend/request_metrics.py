@@ -0,0 +1,98 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per-route request metrics and Server-Timing headers"""
+
+import time
+
+from flask import Response, before_render_template, g, request, template_rendered
+
+from metrics import ServerTiming, counter, gauge, histogram, render
+
+REQUEST_LATENCY = histogram('frontend_request_duration_seconds',
+                            'Latency of frontend requests',
+                            labels=('route', 'method'))
+REQUESTS_IN_FLIGHT = gauge('frontend_requests_in_flight',
+                           'Frontend requests currently being served',
+                           labels=('route',))
+REQUEST_ERRORS = counter('frontend_request_errors_total',
+                         'Frontend requests that failed with a 5xx status',
+                         labels=('route',))
+
+
+def _route_label():
+    """Return the matched route pattern, so metrics don't grow per URL"""
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def instrument(app):
+    """Time every request of app and serve the metrics registry on /metrics.
+
+    Handlers add stages to g.timing, a ServerTiming, which is sent back as
+    the Server-Timing header together with the total.
+    """
+    # pylint: disable=unused-variable
+    @app.before_request
+    def start_timing():
+        """
+        Start timing the request for metrics and the Server-Timing header
+        """
+        g.timing = ServerTiming()
+        g.request_start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc(route=_route_label())
+
+    @app.after_request
+    def add_server_timing(response):
+        """
+        Report the time spent in each stage of the request to the browser
+        """
+        if 'timing' in g:
+            g.timing.add('total', time.perf_counter() - g.request_start)
+            response.headers['Server-Timing'] = g.timing.header()
+        if response.status_code >= 500:
+            REQUEST_ERRORS.inc(route=_route_label())
+            g.error_counted = True
+        return response
+
+    @app.teardown_request
+    def record_request(error):
+        """
+        Record the request latency once the response, streamed or not, is done
+        """
+        if 'request_start' not in g:
+            return
+        route = _route_label()
+        REQUESTS_IN_FLIGHT.dec(route=route)
+        REQUEST_LATENCY.observe(time.perf_counter() - g.request_start,
+                                route=route, method=request.method)
+        # an unhandled exception was already counted by its 500 response;
+        # this catches failures while streaming the body of a 200
+        if error is not None and not g.get('error_counted'):
+            REQUEST_ERRORS.inc(route=route)
+
+    @before_render_template.connect_via(app)
+    def _start_render_timing(_sender, **_extra):
+        g.render_start = time.perf_counter()
+
+    @template_rendered.connect_via(app)
+    def _finish_render_timing(_sender, **_extra):
+        if 'timing' in g and 'render_start' in g:
+            g.timing.add('render', time.perf_counter() - g.render_start)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """
+        Prometheus metrics endpoint
+        """
+        return Response(render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,122 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""gzip compression of responses, including streamed ones"""
+
+import time
+import zlib
+
+from flask import request
+
+from metrics import counter, histogram
+
+COMPRESSIBLE_TYPES = ('text/html', 'text/plain', 'text/css', 'text/javascript',
+                      'application/javascript', 'application/json', 'image/svg+xml')
+
+# wbits for a gzip header and trailer around the deflate stream
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+RESPONSE_BYTES = counter('frontend_response_bytes_total',
+                         'Bytes of compressed responses before and after compression',
+                         labels=('stage',))
+RESPONSE_SIZE = histogram('frontend_response_size_bytes',
+                          'Size of response bodies as sent, by encoding',
+                          labels=('encoding',),
+                          buckets=(1024, 4096, 16384, 65536, 262144, 1048576))
+COMPRESSION_CPU = histogram('frontend_compression_cpu_seconds',
+                            'CPU time spent compressing each response',
+                            buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1))
+
+
+class Compressor:
+    """Compresses responses with gzip for clients that accept it.
+
+    Responses smaller than min_size, already encoded, or of a type that
+    doesn't compress well are sent as-is. Streamed responses are
+    compressed chunk by chunk, with a flush after each chunk so the client
+    can render what has arrived.
+    """
+
+    def __init__(self, min_size=1024, level=6):
+        """Initialize a compressor"""
+        self.min_size = min_size
+        self.level = level
+
+    def _should_compress(self, response):
+        """Whether response is worth compressing for this request"""
+        return (response.status_code not in (204, 304)
+                and 200 <= response.status_code
+                and not response.direct_passthrough
+                and 'Content-Encoding' not in response.headers
+                and response.mimetype in COMPRESSIBLE_TYPES
+                and 'gzip' in request.accept_encodings)
+
+    def compress(self, response):
+        """after_request hook: compress response if the client accepts gzip"""
+        if response.mimetype in COMPRESSIBLE_TYPES:
+            # the encoding depends on the request, for caches as well
+            response.vary.add('Accept-Encoding')
+        if response.is_streamed or response.direct_passthrough:
+            if not self._should_compress(response):
+                return response
+            response.response = self._compress_stream(response.response)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size or not self._should_compress(response):
+                RESPONSE_SIZE.observe(len(data), encoding='identity')
+                return response
+            start = time.thread_time()
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, GZIP_WBITS)
+            compressed = compressor.compress(data) + compressor.flush()
+            self._observe(len(data), len(compressed), time.thread_time() - start)
+            response.set_data(compressed)
+        response.headers['Content-Encoding'] = 'gzip'
+        # the entity differs from the uncompressed one, but is equivalent
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _compress_stream(self, chunks):
+        """Yield a gzip stream of chunks, flushed after every chunk"""
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, GZIP_WBITS)
+        size = 0
+        compressed_size = 0
+        cpu = 0
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            start = time.thread_time()
+            out = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            cpu += time.thread_time() - start
+            size += len(chunk)
+            compressed_size += len(out)
+            yield out
+        out = compressor.flush()
+        compressed_size += len(out)
+        yield out
+        self._observe(size, compressed_size, cpu)
+
+    @staticmethod
+    def _observe(size, compressed_size, cpu):
+        """Record the effect and cost of compressing one response"""
+        RESPONSE_BYTES.inc(size, stage='uncompressed')
+        RESPONSE_BYTES.inc(compressed_size, stage='compressed')
+        RESPONSE_SIZE.observe(compressed_size, encoding='gzip')
+        COMPRESSION_CPU.observe(cpu)
+
+    def register(self, app):
+        """Compress the responses of app"""
+        app.after_request(self.compress)
@@ -0,0 +1,93 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fingerprinted, precompressed static assets"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import Response, abort, request
+
+# types worth compressing; images are already compressed
+COMPRESSIBLE_TYPES = ('text/css', 'text/javascript', 'application/javascript',
+                      'image/svg+xml')
+
+
+class StaticAssets:
+    """Serves files under static_folder at URLs that change with their content.
+
+    At startup every file is read, hashed and, if compressible, compressed
+    with gzip.
+    styles/cymbal.css is then served from memory as
+    assets/styles/cymbal.<hash>.css, which clients may cache forever:
+    when the file changes, so does its URL. Templates get these URLs from
+    {{ static_url('styles/cymbal.css') }}.
+    """
+
+    def __init__(self, static_folder, url_prefix='assets'):
+        """Fingerprint and compress every file under static_folder"""
+        self.url_prefix = url_prefix
+        # original path -> fingerprinted path
+        self.urls = {}
+        # fingerprinted path -> (mimetype, etag, {encoding: bytes})
+        self.files = {}
+        for root, _, names in os.walk(static_folder):
+            for name in names:
+                path = os.path.join(root, name)
+                self._add(os.path.relpath(path, static_folder).replace(os.sep, '/'), path)
+
+    def _add(self, name, path):
+        """Fingerprint and compress one file"""
+        with open(path, 'rb') as asset:
+            content = asset.read()
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        base, ext = os.path.splitext(name)
+        fingerprinted = f'{base}.{digest}{ext}'
+        mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        encodings = {'identity': content}
+        if mimetype in COMPRESSIBLE_TYPES:
+            encodings['gzip'] = gzip.compress(content, compresslevel=9, mtime=0)
+        self.urls[name] = fingerprinted
+        self.files[fingerprinted] = (mimetype, digest, encodings)
+
+    def url(self, name):
+        """Return the fingerprinted URL of a static file, relative like the templates' links"""
+        fingerprinted = self.urls.get(name)
+        if fingerprinted is None:
+            # not known at startup; fall back to Flask's static route
+            return f'static/{name}'
+        return f'{self.url_prefix}/{fingerprinted}'
+
+    def send(self, filename):
+        """Respond with a fingerprinted file in the best encoding the client accepts"""
+        entry = self.files.get(filename)
+        if entry is None:
+            return abort(404)
+        mimetype, digest, encodings = entry
+        encoding = 'gzip' if ('gzip' in encodings
+                              and 'gzip' in request.accept_encodings) else 'identity'
+        response = Response(encodings[encoding], mimetype=mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        response.set_etag(f'{digest}-{encoding}')
+        return response.make_conditional(request)
+
+    def register(self, app):
+        """Serve the assets from app and expose static_url() to its templates"""
+        app.add_url_rule(f'/{self.url_prefix}/<path:filename>', 'assets', self.send)
+        app.jinja_env.globals.update(static_url=self.url)
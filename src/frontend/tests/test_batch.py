@@ -0,0 +1,62 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for batch module
+"""
+
+import unittest
+
+from frontend.batch import MAX_AMOUNT, to_cents, validate_payments
+
+EXAMPLE_ACCOUNT = '1033623433'
+
+
+class TestBatch(unittest.TestCase):
+    """
+    Test cases for batch module
+    """
+
+    def test_to_cents(self):
+        """test converting dollars to cents"""
+        self.assertEqual(150, to_cents('1.5'))
+        self.assertEqual(MAX_AMOUNT, to_cents('21474836.47'))
+
+    def test_to_cents_rejects_invalid_amounts(self):
+        """test that unparsable, non-finite and oversized amounts raise ValueError"""
+        for user_input in ('abc', '', 'NaN', 'Infinity', '-Infinity', '1e30',
+                           '21474836.48', '9e999999', '-9e999999'):
+            with self.subTest(user_input=user_input):
+                with self.assertRaises(ValueError):
+                    to_cents(user_input)
+
+    def test_validate_payments_reports_row_errors(self):
+        """test that every invalid row is reported and valid rows are kept"""
+        payments, errors = validate_payments([
+            {'account_num': EXAMPLE_ACCOUNT, 'amount': '9e999999'},
+            {'account_num': EXAMPLE_ACCOUNT, 'amount': 'Infinity'},
+            {'account_num': EXAMPLE_ACCOUNT, 'amount': '0'},
+            {'account_num': '', 'amount': '1'},
+            {'account_num': EXAMPLE_ACCOUNT, 'amount': '12.34'},
+        ], batch_id='batch-1')
+        self.assertEqual([0, 1, 2, 3], [error['index'] for error in errors])
+        self.assertEqual(1, len(payments))
+        self.assertEqual(1234, payments[0]['amount'])
+
+    def test_validate_payments_uuids_stable_per_batch_id(self):
+        """test that resubmitting a batch with the same batch_id reuses its uuids"""
+        rows = [{'account_num': EXAMPLE_ACCOUNT, 'amount': '1'}]
+        first, _ = validate_payments(rows, batch_id='batch-1')
+        second, _ = validate_payments(rows, batch_id='batch-1')
+        self.assertEqual(first[0]['uuid'], second[0]['uuid'])
@@ -0,0 +1,67 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for cache module
+"""
+
+import unittest
+
+from frontend.cache import TTLCache
+
+
+class TestCache(unittest.TestCase):
+    """
+    Test cases for cache module
+    """
+
+    def setUp(self):
+        """Create a small cache"""
+        self.cache = TTLCache(max_size=2, ttl=60)
+
+    def test_get_set_invalidate(self):
+        """test that invalidate drops a cached value"""
+        self.assertIsNone(self.cache.get('user'))
+        self.cache.set('user', ['contact'])
+        self.assertEqual(['contact'], self.cache.get('user'))
+        self.cache.invalidate('user')
+        self.assertIsNone(self.cache.get('user'))
+        self.assertEqual(1, self.cache.stats()['invalidations'])
+
+    def test_least_recently_used_evicted(self):
+        """test that the least recently used entry makes room"""
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(1, self.cache.get('a'))
+
+    def test_expired_entry_missing(self):
+        """test that an entry is gone after ttl"""
+        cache = TTLCache(max_size=2, ttl=0)
+        cache.set('user', ['contact'])
+        self.assertIsNone(cache.get('user'))
+
+    def test_set_after_invalidation_ignored(self):
+        """test that a read which raced an invalidation isn't cached"""
+        generation = self.cache.generation
+        self.assertIsNone(self.cache.get('user'))
+        # a contact is added while the old list is being fetched
+        self.cache.invalidate('user')
+        self.cache.set('user', ['old contact'], generation)
+        self.assertIsNone(self.cache.get('user'))
+        generation = self.cache.generation
+        self.cache.set('user', ['old contact', 'new contact'], generation)
+        self.assertEqual(['old contact', 'new contact'], self.cache.get('user'))
@@ -0,0 +1,109 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for fanout module
+"""
+
+import asyncio
+import threading
+import unittest
+
+import httpx
+
+from frontend.api_call import SingleFlight
+from frontend.fanout import aggregate, gather_calls
+
+
+class FakeCall:
+    """ApiCall stand-in answering with response after delay seconds"""
+
+    def __init__(self, display_name, response, delay=0):
+        self.display_name = display_name
+        self.response = response
+        self.delay = delay
+
+    async def make_call(self):
+        """Return the response, or None like a failed ApiCall"""
+        await asyncio.sleep(self.delay)
+        return self.response
+
+
+class TestFanout(unittest.TestCase):
+    """
+    Test cases for fanout module
+    """
+
+    def test_gather_calls_keeps_defaults_of_failed_calls(self):
+        """test that only successful calls replace their default value"""
+        api_response = asyncio.run(gather_calls(
+            [FakeCall('balance', httpx.Response(200, json=100)),
+             FakeCall('history', None),
+             FakeCall('contacts', httpx.Response(503, json={}))],
+            {'balance': None, 'history': None, 'contacts': []}))
+        self.assertEqual({'balance': 100, 'history': None, 'contacts': []}, api_response)
+
+    def test_gather_calls_runs_calls_concurrently(self):
+        """test that the calls wait on one event loop at the same time"""
+        async def timed():
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            await gather_calls([FakeCall(str(i), httpx.Response(200, json=i), delay=0.2)
+                                for i in range(3)], {})
+            return loop.time() - start
+        self.assertLess(asyncio.run(timed()), 0.5)
+
+    def test_late_call_passed_to_on_late(self):
+        """test that a call past the soft timeout is returned later through on_late"""
+        late = []
+
+        async def run():
+            api_response = await gather_calls(
+                [FakeCall('balance', httpx.Response(200, json=100), delay=0.2)],
+                {'balance': None}, soft_timeout=0.05, on_late={'balance': late.append})
+            self.assertEqual({'balance': None}, api_response)
+            await asyncio.sleep(0.3)
+        asyncio.run(run())
+        self.assertEqual([100], late)
+
+    def test_aggregate_from_threads(self):
+        """test the blocking entry point from several request threads"""
+        results = []
+
+        def request(i):
+            results.append(aggregate([FakeCall('balance', httpx.Response(200, json=i))],
+                                     {'balance': None})['balance'])
+        threads = [threading.Thread(target=request, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertCountEqual([0, 1, 2, 3], results)
+
+    def test_single_flight_shares_call(self):
+        """test that identical calls in flight share one upstream request"""
+        flights = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'response'
+
+        async def run():
+            return await asyncio.gather(*(flights.do('key', fetch, 1) for _ in range(3)))
+        results = asyncio.run(run())
+        self.assertEqual(1, len(calls))
+        self.assertEqual([('response', False), ('response', True), ('response', True)], results)
+        self.assertEqual({}, flights.calls)
@@ -0,0 +1,49 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for history module
+"""
+
+import unittest
+
+from frontend.history import paginate_history
+
+EXAMPLE_HISTORY = [{'transactionId': 10 - i, 'amount': 100 + i} for i in range(10)]
+
+
+class TestHistory(unittest.TestCase):
+    """
+    Test cases for history module
+    """
+
+    def test_paginate_history_pages(self):
+        """test following the next cursor through every page"""
+        page, cursor = paginate_history(EXAMPLE_HISTORY, None, 4)
+        self.assertEqual([10, 9, 8, 7], [t['transactionId'] for t in page])
+        page, cursor = paginate_history(EXAMPLE_HISTORY, cursor, 4)
+        self.assertEqual([6, 5, 4, 3], [t['transactionId'] for t in page])
+        page, cursor = paginate_history(EXAMPLE_HISTORY, cursor, 4)
+        self.assertEqual([2, 1], [t['transactionId'] for t in page])
+        self.assertIsNone(cursor)
+
+    def test_paginate_history_none(self):
+        """test that a failed history call has no pages"""
+        self.assertEqual((None, None), paginate_history(None, None, 4))
+
+    def test_paginate_history_returns_copies(self):
+        """test that fields added to a page don't change the history it came from"""
+        page, _ = paginate_history(EXAMPLE_HISTORY, None, 4)
+        page[0]['displayMonth'] = 'Mar'
+        self.assertNotIn('displayMonth', EXAMPLE_HISTORY[0])
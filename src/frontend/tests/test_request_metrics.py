@@ -0,0 +1,78 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for request_metrics module
+"""
+
+import unittest
+
+from flask import Flask, Response, stream_with_context
+
+from frontend.request_metrics import REQUEST_ERRORS, instrument
+
+
+def _errors(route):
+    """Return the error count of route"""
+    return REQUEST_ERRORS.values.get((route,), 0)
+
+
+class TestRequestMetrics(unittest.TestCase):
+    """
+    Test cases for request_metrics module
+    """
+
+    def setUp(self):
+        """Create an instrumented app with failing routes"""
+        app = Flask('test')
+        instrument(app)
+
+        @app.route('/boom')
+        def boom():
+            raise RuntimeError('boom')
+
+        @app.route('/unavailable')
+        def unavailable():
+            return 'unavailable', 503
+
+        @app.route('/stream')
+        def stream():
+            def body():
+                yield 'partial'
+                raise RuntimeError('stream')
+            return Response(stream_with_context(body()))
+
+        app.logger.disabled = True
+        self.test_app = app.test_client()
+
+    def test_unhandled_exception_counted_once(self):
+        """test that an exception and the 500 response it produces count as one error"""
+        before = _errors('/boom')
+        self.assertEqual(500, self.test_app.get('/boom').status_code)
+        self.assertEqual(before + 1, _errors('/boom'))
+
+    def test_error_status_counted(self):
+        """test that a 5xx returned by a handler is counted"""
+        before = _errors('/unavailable')
+        self.test_app.get('/unavailable')
+        self.assertEqual(before + 1, _errors('/unavailable'))
+
+    def test_streamed_body_failure_counted(self):
+        """test that a failure after a 200 was sent is counted"""
+        before = _errors('/stream')
+        response = self.test_app.get('/stream')
+        self.assertEqual(200, response.status_code)
+        with self.assertRaises(RuntimeError):
+            response.get_data()
+        self.assertEqual(before + 1, _errors('/stream'))
@@ -0,0 +1,77 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cache of verified JWT claims"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
+
+
+class VerifiedClaimsCache:
+    """Bounded LRU cache of verified token claims.
+
+    Entries are keyed by a hash of the token and expire at the token's `exp`
+    claim, so a token is only RS256-verified once while it is valid. Tokens
+    without an `exp` claim are verified on every call.
+    """
+
+    def __init__(self, public_key_pem, max_size=1024):
+        """Load the public key once and initialize an empty cache"""
+        self.public_key = load_pem_public_key(public_key_pem.encode())
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def verify(self, token):
+        """Return the verified claims of token.
+
+        Raises: jwt.exceptions.InvalidTokenError if the token is not valid
+        """
+        key = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+
+        claims = jwt.decode(algorithms='RS256',
+                            jwt=token,
+                            key=self.public_key,
+                            options={"verify_signature": True})
+        if 'exp' in claims:
+            with self.lock:
+                self.entries[key] = (claims['exp'], claims)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+        return claims
+
+    def stats(self):
+        """Return hit and miss counters"""
+        with self.lock:
+            return {'size': len(self.entries),
+                    'hits': self.hits,
+                    'misses': self.misses}
@@ -14,8 +14,14 @@
 
 """Enable tracing with a ThreadPoolExecutor"""
 
+import os
+import threading
 from concurrent.futures import ThreadPoolExecutor
 from opentelemetry import context as otel_context
+from opentelemetry import trace
+
+from metrics import collector
+
 
 class TracedThreadPoolExecutor(ThreadPoolExecutor):
     """Implementation of :class:`ThreadPoolExecutor` that will pass context into sub tasks."""
@@ -23,24 +29,97 @@ class TracedThreadPoolExecutor(ThreadPoolExecutor):
     def __init__(self, tracer, *args, **kwargs):
         """Initialize TracedThreadPoolExecutor"""
         self.tracer = tracer
+        self.active = 0
+        self.submitted = 0
+        self.active_lock = threading.Lock()
         super().__init__(*args, **kwargs)
 
     def with_otel_context(self, context, function):
-        """Attach context"""
-        otel_context.attach(context)
-        return function()
+        """Attach context for the duration of function, then restore the worker's context"""
+        token = otel_context.attach(context)
+        try:
+            return function()
+        finally:
+            otel_context.detach(token)
+
+    def _tracked(self, function):
+        """Count function as active while it runs on a worker thread"""
+        with self.active_lock:
+            self.active += 1
+        try:
+            return function()
+        finally:
+            with self.active_lock:
+                self.active -= 1
 
     # pylint: disable-msg=arguments-differ
     def submit(self, function, *args, **kwargs):
         """Submit a new task to the thread pool."""
+        with self.active_lock:
+            self.submitted += 1
 
         # get the current otel context
         context = otel_context.get_current()
         if context:
             return super().submit(
-                lambda: self.with_otel_context(
-                    context, lambda: function(*args, **kwargs)
+                lambda: self._tracked(
+                    lambda: self.with_otel_context(
+                        context, lambda: function(*args, **kwargs)
+                    )
                 ),
             )
 
-        return super().submit(lambda: function(*args, **kwargs))
+        return super().submit(lambda: self._tracked(lambda: function(*args, **kwargs)))
+
+    def stats(self):
+        """Return queue depth and saturation of the pool"""
+        with self.active_lock:
+            active = self.active
+            submitted = self.submitted
+        return {'max_workers': self._max_workers,
+                'active': active,
+                'queue_depth': self._work_queue.qsize(),
+                'saturation': active / self._max_workers,
+                'submitted': submitted}
+
+
+_EXECUTORS = {}
+_EXECUTORS_PID = None
+_EXECUTORS_LOCK = threading.Lock()
+
+
+def get_executor(name, default_workers=12):
+    """Return the process-wide executor called name.
+
+    The pool is bounded by the <NAME>_MAX_WORKERS environment variable, or
+    default_workers if it isn't set. Pools are created per worker process,
+    since threads do not survive a fork.
+    """
+    global _EXECUTORS_PID  # pylint: disable=global-statement
+    with _EXECUTORS_LOCK:
+        if _EXECUTORS_PID != os.getpid():
+            _EXECUTORS.clear()
+            _EXECUTORS_PID = os.getpid()
+        executor = _EXECUTORS.get(name)
+        if executor is None:
+            executor = TracedThreadPoolExecutor(
+                trace.get_tracer(__name__),
+                max_workers=int(os.getenv(f'{name.upper()}_MAX_WORKERS',
+                                          str(default_workers))),
+                thread_name_prefix=name)
+            _EXECUTORS[name] = executor
+        return executor
+
+
+@collector('frontend_executor_threads', 'gauge',
+           'Executor worker threads, queued tasks and saturation by pool')
+def _executor_stats():
+    """Export the stats of this process's executors"""
+    with _EXECUTORS_LOCK:
+        executors = dict(_EXECUTORS) if _EXECUTORS_PID == os.getpid() else {}
+    samples = []
+    for name, executor in executors.items():
+        stats = executor.stats()
+        for key in ('max_workers', 'active', 'queue_depth', 'saturation'):
+            samples.append(({'pool': name, 'stat': key}, stats[key]))
+    return samples